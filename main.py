@@ -1,17 +1,25 @@
 import os
 import logging
-from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Any, Union, Tuple
+from datetime import datetime, timedelta, date
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+from typing import Optional, Dict, List, Any, Union, Tuple, Callable, Awaitable
 from dotenv import load_dotenv
-from aiogram import Bot, Dispatcher, types, Router, F
+from aiogram import Bot, Dispatcher, types, Router, F, BaseMiddleware
 from aiogram.filters import Command, CommandStart
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import Message, CallbackQuery, TelegramObject
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.storage.memory import MemoryStorage
 import sqlite3
-import pytz
+import aiosqlite
 import asyncio
+import bisect
+import calendar
+import inspect
+import time
 
 # Загружаем переменные окружения из файла .env
 load_dotenv()
@@ -24,8 +32,16 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Конфигурация
-MOSCOW_TZ = pytz.timezone('Europe/Moscow')
+MOSCOW_TZ = ZoneInfo('Europe/Moscow')
 DB_NAME = 'baby_tracker.db'
+SCHEMA_VERSION = 3  # хранится в PRAGMA user_version, повышать при изменении схемы
+MIN_SQLITE_VERSION = (3, 35)  # первая версия SQLite с UPDATE/INSERT/DELETE ... RETURNING
+CACHE_TTL = 300  # секунд, время жизни кэша детей и измерений
+CACHE_MAX_SIZE = 1024  # чатов в каждом кэше, самые давние вытесняются
+STATS_CACHE_TTL = 30  # секунд, время жизни кэша дневной статистики
+REMINDER_SEND_CONCURRENCY = 20  # одновременных отправок напоминаний
+REMINDER_HOUR = 10  # час по Москве, в который рассылаются напоминания
+MESSAGE_LIMIT = 3500  # символов в сообщении, с запасом до лимита Telegram в 4096 (эмодзи считаются дважды)
 API_TOKEN = os.getenv('API_TOKEN')
 
 # Проверяем наличие токена
@@ -73,629 +89,934 @@ class CustomFeedingAmount(StatesGroup):
     waiting_for_custom_amount = State()
     waiting_for_cancel = State()
 
+# --- Callback-данные ---
+class AddEatenCallback(CallbackData, prefix="add"):
+    """Быстрое добавление съеденного (add:<мл>)"""
+    ml: int
+
 # --- База данных ---
 class Database:
     def __init__(self, db_name='baby_tracker.db'):
         self.db_name = db_name
         self.timeout = 30
-        self.init_db()
-    
-    def get_connection(self):
-        conn = sqlite3.connect(self.db_name, timeout=self.timeout)
-        conn.row_factory = sqlite3.Row
-        return conn
-    
-    def init_db(self):
-        conn = self.get_connection()
+        # Кэш редко меняющихся строк: ключ -> (время записи, строка)
+        self._child_cache: Dict[int, Tuple[float, Optional[Dict[str, Any]]]] = {}
+        self._measurement_cache: Dict[int, Tuple[float, Optional[Dict[str, Any]]]] = {}
+        # Дневная статистика: (child_id, дата) -> (время записи, результат запроса)
+        self._sleep_stats_cache: Dict[Tuple[int, str], Tuple[float, Any]] = {}
+        self._wake_stats_cache: Dict[Tuple[int, str], Tuple[float, Any]] = {}
+        self._diaper_stats_cache: Dict[Tuple[int, str], Tuple[float, Any]] = {}
+        self._stats_screen_cache: Dict[Tuple[int, str], Tuple[float, Any]] = {}
+        # Счетчик сбросов кэша: не сохраняем строку, прочитанную до сброса
+        self._cache_generation = 0
+        # Соединение открывается в connect() при запуске бота
+        self._conn: Optional[aiosqlite.Connection] = None
+        # Записи на общем соединении идут по одной, чтобы транзакции не перемешивались.
+        # Создается в connect(): до Python 3.10 примитивы asyncio привязываются к циклу при создании
+        self._write_lock: Optional[asyncio.Lock] = None
+        # Будит check_reminders, когда сроки напоминаний меняются; как и блокировка, создается в connect()
+        self.reminders_changed: Optional[asyncio.Event] = None
+    
+    async def connect(self):
+        """Открывает постоянное соединение и создает схему"""
+        # Без RETURNING не работают начало и конец сна, бодрствования и кормления
+        if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+            required = '.'.join(map(str, MIN_SQLITE_VERSION))
+            logger.error(f"SQLite {sqlite3.sqlite_version} слишком старая, нужна {required} или новее")
+            raise RuntimeError(f"Нужна SQLite {required} или новее, установлена {sqlite3.sqlite_version}")
+        self._write_lock = asyncio.Lock()
+        self.reminders_changed = asyncio.Event()
+        # Одно соединение на всё время работы бота: схема разбирается один раз,
+        # а sqlite3 кэширует на нём подготовленные запросы.
+        # aiosqlite выполняет запросы в отдельном потоке и не блокирует цикл событий.
+        # Режим автокоммита: одиночные запросы фиксируются сами, а записи из нескольких
+        # запросов явно открывают транзакцию через BEGIN IMMEDIATE
+        self._conn = await aiosqlite.connect(self.db_name, timeout=self.timeout,
+                                             cached_statements=256, isolation_level=None)
+        self._conn.row_factory = aiosqlite.Row
+        # Размер страницы применяется только к новой базе и только до перехода в WAL
+        await self._conn.execute('PRAGMA page_size=8192')
+        cursor = await self._conn.execute('PRAGMA journal_mode=WAL')
+        journal_mode = (await cursor.fetchone())[0]
+        if journal_mode != 'wal':
+            # SQLite молча остается в прежнем режиме, например на сетевой файловой системе
+            logger.warning(f"Не удалось включить WAL, режим журнала: {journal_mode}")
+        await self._conn.execute('PRAGMA synchronous=NORMAL')
+        await self._conn.execute('PRAGMA temp_store=MEMORY')
+        await self._conn.execute('PRAGMA mmap_size=268435456')
+        await self._conn.execute('PRAGMA cache_size=-20000')
+        # Ссылки на children объявлены в схеме, но без этого не проверяются
+        await self._conn.execute('PRAGMA foreign_keys=ON')
+        # timeout в connect() уже выставил то же ожидание занятой базы;
+        # PRAGMA лишь явно фиксирует его рядом с остальными настройками
+        await self._conn.execute(f'PRAGMA busy_timeout={int(self.timeout * 1000)}')
+        await self.init_db()
+    
+    async def close(self):
+        """Закрывает соединение при остановке бота"""
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+    
+    async def init_db(self):
+        """Создает таблицы и индексы одной транзакцией, если схема в базе устарела"""
+        conn = self._conn
+        cursor = await conn.execute('PRAGMA user_version')
+        if (await cursor.fetchone())[0] >= SCHEMA_VERSION:
+            return
+        # DDL в sqlite3 сам транзакцию не открывает, и без BEGIN каждая таблица коммитится отдельно.
+        # IMMEDIATE сразу берет блокировку записи, и одновременно запущенные копии бота
+        # обновляют схему по очереди
+        await conn.execute('BEGIN IMMEDIATE')
         try:
-            cursor = conn.cursor()
-            
-            # Таблица детей
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS children (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id INTEGER NOT NULL,
-                    first_name TEXT NOT NULL,
-                    last_name TEXT,
-                    gender TEXT NOT NULL,
-                    birth_date DATE NOT NULL,
-                    gestation_weeks INTEGER NOT NULL,
-                    gestation_days INTEGER NOT NULL,
-                    birth_weight REAL NOT NULL,
-                    birth_height INTEGER NOT NULL,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица кормлений
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS feedings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id INTEGER NOT NULL,
-                    child_id INTEGER NOT NULL,
-                    start_time TIMESTAMP NOT NULL,
-                    end_time TIMESTAMP,
-                    prepared_ml INTEGER,
-                    total_eaten_ml INTEGER,
-                    is_paused INTEGER DEFAULT 0,
-                    paused_at TIMESTAMP,
-                    pauses_count INTEGER DEFAULT 0,
-                    total_pause_duration INTEGER DEFAULT 0,
-                    FOREIGN KEY (child_id) REFERENCES children (id)
-                )
-            ''')
-            
-            # Таблица измерений (вес/рост)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS measurements (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    child_id INTEGER NOT NULL,
-                    weight REAL NOT NULL,
-                    height INTEGER NOT NULL,
-                    measurement_date DATE NOT NULL,
-                    age_days INTEGER NOT NULL,
-                    recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (child_id) REFERENCES children (id)
-                )
-            ''')
-            
-            # Таблица напоминаний
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS reminders (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    chat_id INTEGER NOT NULL,
-                    child_id INTEGER NOT NULL,
-                    reminder_type TEXT NOT NULL,
-                    next_reminder DATE NOT NULL,
-                    frequency_days INTEGER NOT NULL,
-                    is_active INTEGER DEFAULT 1,
-                    FOREIGN KEY (child_id) REFERENCES children (id)
-                )
-            ''')
-            
-            # Таблица сна
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sleep_tracker (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    child_id INTEGER NOT NULL,
-                    sleep_start TIMESTAMP NOT NULL,
-                    sleep_end TIMESTAMP,
-                    duration_minutes INTEGER,
-                    notes TEXT,
-                    FOREIGN KEY (child_id) REFERENCES children (id)
-                )
-            ''')
-            
-            # Таблица бодрствования
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS wakefulness_tracker (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    child_id INTEGER NOT NULL,
-                    wake_start TIMESTAMP NOT NULL,
-                    wake_end TIMESTAMP,
-                    duration_minutes INTEGER,
-                    notes TEXT,
-                    FOREIGN KEY (child_id) REFERENCES children (id)
-                )
-            ''')
-            
-            # Таблица подгузников
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS diaper_tracker (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    child_id INTEGER NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    type TEXT NOT NULL,
-                    notes TEXT,
-                    FOREIGN KEY (child_id) REFERENCES children (id)
-                )
-            ''')
-            
-            # Таблица заметок
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS journal_notes (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    child_id INTEGER NOT NULL,
-                    note TEXT NOT NULL,
-                    category TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (child_id) REFERENCES children (id)
-                )
-            ''')
-            
-            conn.commit()
-        finally:
-            conn.close()
+            await self._create_schema(conn)
+            await conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            await conn.commit()
+        except Exception as e:
+            await conn.rollback()
+            raise e
     
-    def get_child(self, chat_id: int) -> Optional[sqlite3.Row]:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM children WHERE chat_id = ?', (chat_id,))
-            return cursor.fetchone()
-        finally:
-            conn.close()
-    
-    def register_child(self, chat_id: int, child_data: dict) -> int:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO children 
-                (chat_id, first_name, last_name, gender, birth_date, gestation_weeks, gestation_days, birth_weight, birth_height)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                chat_id,
-                child_data['first_name'],
-                child_data['last_name'],
-                child_data['gender'],
-                child_data['birth_date'],
-                child_data['gestation_weeks'],
-                child_data['gestation_days'],
-                child_data['birth_weight'],
-                child_data['birth_height']
-            ))
+    async def _create_schema(self, conn: aiosqlite.Connection):
+        # Таблица детей
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS children (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                first_name TEXT NOT NULL,
+                last_name TEXT,
+                gender TEXT NOT NULL,
+                birth_date DATE NOT NULL,
+                gestation_weeks INTEGER NOT NULL,
+                gestation_days INTEGER NOT NULL,
+                birth_weight REAL NOT NULL,
+                birth_height INTEGER NOT NULL,
+                registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Таблица кормлений
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS feedings (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                child_id INTEGER NOT NULL,
+                start_time TIMESTAMP NOT NULL,
+                end_time TIMESTAMP,
+                prepared_ml INTEGER,
+                total_eaten_ml INTEGER,
+                is_paused INTEGER DEFAULT 0,
+                paused_at TIMESTAMP,
+                pauses_count INTEGER DEFAULT 0,
+                total_pause_duration INTEGER DEFAULT 0,
+                FOREIGN KEY (child_id) REFERENCES children (id)
+            )
+        ''')
+        
+        # Итоги кормлений по дням для недельной статистики, их ведут триггеры на feedings
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS feeding_daily (
+                child_id INTEGER NOT NULL,
+                feeding_date TEXT NOT NULL,
+                feedings_count INTEGER NOT NULL DEFAULT 0,
+                total_ml INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (child_id, feeding_date)
+            ) WITHOUT ROWID
+        ''')
+        await conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS feeding_daily_insert AFTER INSERT ON feedings
+            BEGIN
+                INSERT INTO feeding_daily (child_id, feeding_date, feedings_count, total_ml)
+                VALUES (NEW.child_id, substr(NEW.start_time, 1, 10), 1, COALESCE(NEW.total_eaten_ml, 0))
+                ON CONFLICT (child_id, feeding_date) DO UPDATE SET
+                    feedings_count = feedings_count + 1,
+                    total_ml = total_ml + excluded.total_ml;
+            END
+        ''')
+        await conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS feeding_daily_update AFTER UPDATE OF total_eaten_ml ON feedings
+            BEGIN
+                UPDATE feeding_daily
+                SET total_ml = total_ml + COALESCE(NEW.total_eaten_ml, 0) - COALESCE(OLD.total_eaten_ml, 0)
+                WHERE child_id = NEW.child_id AND feeding_date = substr(NEW.start_time, 1, 10);
+            END
+        ''')
+        await conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS feeding_daily_delete AFTER DELETE ON feedings
+            BEGIN
+                UPDATE feeding_daily
+                SET feedings_count = feedings_count - 1,
+                    total_ml = total_ml - COALESCE(OLD.total_eaten_ml, 0)
+                WHERE child_id = OLD.child_id AND feeding_date = substr(OLD.start_time, 1, 10);
+                DELETE FROM feeding_daily
+                WHERE child_id = OLD.child_id AND feeding_date = substr(OLD.start_time, 1, 10)
+                AND feedings_count <= 0;
+            END
+        ''')
+        # Пересчитываем итоги по уже записанным кормлениям (схема обновляется внутри транзакции)
+        await conn.execute('DELETE FROM feeding_daily')
+        await conn.execute('''
+            INSERT INTO feeding_daily (child_id, feeding_date, feedings_count, total_ml)
+            SELECT child_id, substr(start_time, 1, 10), COUNT(*), COALESCE(SUM(total_eaten_ml), 0)
+            FROM feedings
+            GROUP BY child_id, substr(start_time, 1, 10)
+        ''')
+        
+        # Таблица измерений (вес/рост)
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS measurements (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                child_id INTEGER NOT NULL,
+                weight REAL NOT NULL,
+                height INTEGER NOT NULL,
+                measurement_date DATE NOT NULL,
+                age_days INTEGER NOT NULL,
+                recorded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (child_id) REFERENCES children (id)
+            )
+        ''')
+        
+        # Таблица напоминаний
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                child_id INTEGER NOT NULL,
+                reminder_type TEXT NOT NULL,
+                next_reminder DATE NOT NULL,
+                frequency_days INTEGER NOT NULL,
+                is_active INTEGER DEFAULT 1,
+                FOREIGN KEY (child_id) REFERENCES children (id)
+            )
+        ''')
+        
+        # Таблица сна
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS sleep_tracker (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                child_id INTEGER NOT NULL,
+                sleep_start TIMESTAMP NOT NULL,
+                sleep_end TIMESTAMP,
+                duration_minutes INTEGER,
+                notes TEXT,
+                FOREIGN KEY (child_id) REFERENCES children (id)
+            )
+        ''')
+        
+        # Таблица бодрствования
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS wakefulness_tracker (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                child_id INTEGER NOT NULL,
+                wake_start TIMESTAMP NOT NULL,
+                wake_end TIMESTAMP,
+                duration_minutes INTEGER,
+                notes TEXT,
+                FOREIGN KEY (child_id) REFERENCES children (id)
+            )
+        ''')
+        
+        # Таблица подгузников
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS diaper_tracker (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                child_id INTEGER NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                type TEXT NOT NULL,
+                notes TEXT,
+                FOREIGN KEY (child_id) REFERENCES children (id)
+            )
+        ''')
+        
+        # Таблица заметок
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS journal_notes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                child_id INTEGER NOT NULL,
+                note TEXT NOT NULL,
+                category TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (child_id) REFERENCES children (id)
+            )
+        ''')
+        
+        # Индексы под выборки по ребенку/чату и времени, чтобы не сканировать таблицы целиком
+        indexes = [
+            # total_eaten_ml в индексе: дневные и недельные суммы считаются без чтения таблицы
+            'idx_feedings_child_start_ml ON feedings (child_id, start_time, total_eaten_ml)',
+            'idx_sleep_child_start ON sleep_tracker (child_id, sleep_start)',
+            'idx_wake_child_start ON wakefulness_tracker (child_id, wake_start)',
+            'idx_diaper_child_ts ON diaper_tracker (child_id, timestamp)',
+            'idx_measurements_child_date ON measurements (child_id, measurement_date DESC, recorded_at DESC)',
+            'idx_reminders_active ON reminders (is_active, next_reminder)',
+            'idx_children_chat ON children (chat_id)',
+            'idx_journal_child_created ON journal_notes (child_id, created_at DESC)',
+            # Частичные индексы только по незавершенным записям: их не больше одной-двух на ребенка
+            'idx_feedings_active ON feedings (chat_id, start_time DESC) WHERE end_time IS NULL',
+            'idx_sleep_active ON sleep_tracker (child_id, sleep_start DESC) WHERE sleep_end IS NULL',
+            'idx_wake_active ON wakefulness_tracker (child_id, wake_start DESC) WHERE wake_end IS NULL',
+        ]
+        for index in indexes:
+            await conn.execute(f'CREATE INDEX IF NOT EXISTS {index}')
+        
+        # Полные индексы по end-колонкам заменены частичными, индекс кормлений - покрывающим
+        for index in ('idx_feedings_chat_end', 'idx_sleep_child_end', 'idx_wake_child_end',
+                      'idx_feedings_child_start'):
+            await conn.execute(f'DROP INDEX IF EXISTS {index}')
+    
+    async def get_child(self, chat_id: int) -> Optional[sqlite3.Row]:
+        cursor = await self._conn.execute('SELECT * FROM children WHERE chat_id = ?', (chat_id,))
+        return await cursor.fetchone()
+    
+    async def get_child_cached(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        """То же, что get_child, но с кэшированием на CACHE_TTL секунд.
+        Дата рождения уже разобрана и лежит в ключе '_birth_date', полное имя - в '_full_name'"""
+        return await self._cached(self._child_cache, chat_id, self._load_child)
+    
+    async def _load_child(self, chat_id: int) -> Optional[Dict[str, Any]]:
+        row = await self.get_child(chat_id)
+        if row is None:
+            return None
+        child = dict(row)
+        child['_birth_date'] = date.fromisoformat(child['birth_date'])
+        child['_full_name'] = full_name(child)
+        return child
+    
+    async def _cached(self, cache: dict, key, loader, ttl: float = CACHE_TTL):
+        now = time.monotonic()
+        entry = cache.get(key)
+        if entry and now - entry[0] < ttl:
+            # Переносим в конец: в начале словаря остаются давно не нужные чаты
+            cache[key] = cache.pop(key)
+            return entry[1]
+        generation = self._cache_generation
+        value = await loader(key)
+        # Пока ждали базу, запись могли изменить и сбросить кэш
+        if generation == self._cache_generation:
+            cache.pop(key, None)
+            cache[key] = (now, value)
+            if len(cache) > CACHE_MAX_SIZE:
+                del cache[next(iter(cache))]
+        return value
+    
+    def _invalidate(self, cache: dict, key: int):
+        self._cache_generation += 1
+        cache.pop(key, None)
+    
+    def _invalidate_stats(self, cache: dict, child_id: int):
+        """Сбрасывает дневную статистику ребенка за все даты"""
+        self._cache_generation += 1
+        for key in [key for key in cache if key[0] == child_id]:
+            del cache[key]
+    
+    async def register_child(self, chat_id: int, child_data: dict) -> int:
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                await conn.execute('BEGIN IMMEDIATE')
+                cursor = await conn.execute('''
+                    INSERT INTO children 
+                    (chat_id, first_name, last_name, gender, birth_date, gestation_weeks, gestation_days, birth_weight, birth_height)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    RETURNING id
+                ''', (
+                    chat_id,
+                    child_data['first_name'],
+                    child_data['last_name'],
+                    child_data['gender'],
+                    child_data['birth_date'],
+                    child_data['gestation_weeks'],
+                    child_data['gestation_days'],
+                    child_data['birth_weight'],
+                    child_data['birth_height']
+                ))
             
-            child_id = cursor.lastrowid
+                child_id = (await cursor.fetchone())['id']
             
-            reminders = [
-                ('weight_height', 1),
-                ('weight_height', 7),
-                ('weight_height', 30)
-            ]
+                reminders = [
+                    ('weight_height', 1),
+                    ('weight_height', 7),
+                    ('weight_height', 30)
+                ]
             
-            today = get_moscow_time().date()
-            for reminder_type, frequency in reminders:
-                cursor.execute('''
+                today = get_moscow_time().date()
+                await conn.executemany('''
                     INSERT INTO reminders 
                     (chat_id, child_id, reminder_type, next_reminder, frequency_days)
                     VALUES (?, ?, ?, ?, ?)
-                ''', (chat_id, child_id, reminder_type, today, frequency))
-            
-            conn.commit()
-            return child_id
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def add_measurement(self, child_id: int, weight: float, height: int):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
+                ''', [(chat_id, child_id, reminder_type, today, frequency)
+                      for reminder_type, frequency in reminders])
             
-            cursor.execute('SELECT birth_date FROM children WHERE id = ?', (child_id,))
-            row = cursor.fetchone()
-            if row:
-                birth_date_str = row[0]
-                if isinstance(birth_date_str, str):
-                    birth_date = datetime.strptime(birth_date_str, '%Y-%m-%d').date()
-                    age_days = (get_moscow_time().date() - birth_date).days
-                    current_time = get_moscow_time()
-                    
-                    cursor.execute('''
-                        INSERT INTO measurements (child_id, weight, height, measurement_date, age_days, recorded_at)
-                        VALUES (?, ?, ?, ?, ?, ?)
-                    ''', (child_id, weight, height, get_moscow_time().date(), age_days, current_time))
-                    
-                    cursor.execute('''
+                await conn.commit()
+                self._invalidate(self._child_cache, chat_id)
+                self.reminders_changed.set()
+                return child_id
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def add_measurement(self, child_id: int, weight: float, height: int):
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                await conn.execute('BEGIN IMMEDIATE')
+                current_time = get_moscow_time()
+                today_str = current_time.strftime('%Y-%m-%d')
+                # Возраст считаем прямо в INSERT по дате рождения, без отдельного чтения ребенка
+                cursor = await conn.execute('''
+                    INSERT INTO measurements (child_id, weight, height, measurement_date, age_days, recorded_at)
+                    SELECT id, ?, ?, ?, CAST(julianday(?) - julianday(birth_date) AS INTEGER), ?
+                    FROM children
+                    WHERE id = ?
+                ''', (weight, height, today_str, today_str, current_time, child_id))
+                
+                if cursor.rowcount:
+                    await conn.execute('''
                         UPDATE reminders 
                         SET next_reminder = date(?, '+' || frequency_days || ' days')
                         WHERE child_id = ? AND reminder_type = 'weight_height' AND is_active = 1
-                    ''', (get_moscow_time().strftime('%Y-%m-%d'), child_id))
+                    ''', (today_str, child_id))
             
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+                await conn.commit()
+                self._invalidate(self._measurement_cache, child_id)
+                self._invalidate_stats(self._stats_screen_cache, child_id)
+                self.reminders_changed.set()
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def get_last_measurement(self, child_id: int) -> Optional[sqlite3.Row]:
+        """Последнее измерение вместе с прибавкой веса и роста с рождения"""
+        cursor = await self._conn.execute('''
+            SELECT m.*,
+                m.weight - c.birth_weight as weight_gain,
+                m.height - c.birth_height as height_gain
+            FROM measurements m
+            JOIN children c ON c.id = m.child_id
+            WHERE m.child_id = ? 
+            ORDER BY m.measurement_date DESC, m.recorded_at DESC 
+            LIMIT 1
+        ''', (child_id,))
+        return await cursor.fetchone()
+    
+    async def get_recent_measurements(self, child_id: int, limit: int = 5) -> List[sqlite3.Row]:
+        """Последние измерения ребенка, от новых к старым.
+        recorded_time - часы и минуты записи (ЧЧ:ММ) или NULL, если времени в recorded_at нет"""
+        cursor = await self._conn.execute('''
+            SELECT weight, height, measurement_date,
+                CASE WHEN length(recorded_at) >= 16 AND substr(recorded_at, 11, 1) IN ('T', ' ')
+                    THEN substr(recorded_at, 12, 5) END AS recorded_time
+            FROM measurements
+            WHERE child_id = ?
+            ORDER BY measurement_date DESC, recorded_at DESC
+            LIMIT ?
+        ''', (child_id, limit))
+        return await cursor.fetchall()
     
-    def get_last_measurement(self, child_id: int) -> Optional[sqlite3.Row]:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM measurements 
-                WHERE child_id = ? 
-                ORDER BY measurement_date DESC, recorded_at DESC 
-                LIMIT 1
-            ''', (child_id,))
-            return cursor.fetchone()
-        finally:
-            conn.close()
+    async def get_last_measurement_cached(self, child_id: int) -> Optional[Dict[str, Any]]:
+        """То же, что get_last_measurement, но с кэшированием на CACHE_TTL секунд"""
+        return await self._cached(self._measurement_cache, child_id, self._load_last_measurement)
     
-    # --- Методы для сна ---
-    def start_sleep(self, child_id: int) -> int:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO sleep_tracker (child_id, sleep_start)
-                VALUES (?, ?)
-            ''', (child_id, get_moscow_time()))
-            conn.commit()
-            return cursor.lastrowid
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+    async def _load_last_measurement(self, child_id: int) -> Optional[Dict[str, Any]]:
+        # В кэше держим обычный dict: его читают на каждом экране, а не один раз
+        row = await self.get_last_measurement(child_id)
+        return dict(row) if row else None
     
-    def end_sleep(self, sleep_id: int):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('SELECT sleep_start FROM sleep_tracker WHERE id = ?', (sleep_id,))
-            row = cursor.fetchone()
-            if row:
-                sleep_start = datetime.fromisoformat(row[0])
+    # --- Методы для сна ---
+    async def start_sleep(self, child_id: int) -> int:
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('''
+                    INSERT INTO sleep_tracker (child_id, sleep_start)
+                    VALUES (?, ?)
+                    RETURNING id
+                ''', (child_id, get_moscow_time()))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                return rows[0]['id']
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def end_active_sleep(self, child_id: int) -> Optional[sqlite3.Row]:
+        """Завершает активный сон одним запросом и возвращает завершенную запись (или None)"""
+        async with self._write_lock:
+            conn = self._conn
+            try:
                 sleep_end = get_moscow_time()
-                duration = int((sleep_end - sleep_start).total_seconds() / 60)
-                
-                cursor.execute('''
+                cursor = await conn.execute('''
                     UPDATE sleep_tracker 
-                    SET sleep_end = ?, duration_minutes = ?
-                    WHERE id = ?
-                ''', (sleep_end, duration, sleep_id))
-            
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def get_active_sleep(self, child_id: int) -> Optional[sqlite3.Row]:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM sleep_tracker 
-                WHERE child_id = ? AND sleep_end IS NULL
-                ORDER BY sleep_start DESC 
-                LIMIT 1
-            ''', (child_id,))
-            return cursor.fetchone()
-        finally:
-            conn.close()
-    
-    def get_sleep_stats_today(self, child_id: int):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
+                    SET sleep_end = ?,
+                        duration_minutes = CAST(ROUND((julianday(?) - julianday(sleep_start)) * 86400) AS INTEGER) / 60
+                    WHERE child_id = ? AND sleep_end IS NULL
+                    RETURNING id, sleep_start, sleep_end, duration_minutes
+                ''', (sleep_end, sleep_end, child_id))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                self._invalidate_stats(self._sleep_stats_cache, child_id)
+                self._invalidate_stats(self._stats_screen_cache, child_id)
+                return max(rows, key=lambda row: row['sleep_start']) if rows else None
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def get_active_sleep(self, child_id: int) -> Optional[sqlite3.Row]:
+        cursor = await self._conn.execute('''
+            SELECT * FROM sleep_tracker 
+            WHERE child_id = ? AND sleep_end IS NULL
+            ORDER BY sleep_start DESC 
+            LIMIT 1
+        ''', (child_id,))
+        return await cursor.fetchone()
+    
+    async def get_sleep_stats_today(self, child_id: int, today_str: Optional[str] = None):
+        if today_str is None:
             today_str = get_moscow_time().strftime('%Y-%m-%d')
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as sleep_count,
-                    SUM(duration_minutes) as total_minutes,
-                    AVG(duration_minutes) as avg_minutes
-                FROM sleep_tracker 
-                WHERE child_id = ? 
-                AND DATE(sleep_start) = ?
-                AND sleep_end IS NOT NULL
-            ''', (child_id, today_str))
-            return cursor.fetchone()
-        finally:
-            conn.close()
+        cursor = await self._conn.execute('''
+            SELECT 
+                COUNT(*) as sleep_count,
+                SUM(duration_minutes) as total_minutes,
+                AVG(duration_minutes) as avg_minutes
+            FROM sleep_tracker 
+            WHERE child_id = ? 
+            AND DATE(sleep_start) = ?
+            AND sleep_end IS NOT NULL
+        ''', (child_id, today_str))
+        return await cursor.fetchone()
     
-    # --- Методы для бодрствования ---
-    def start_wakefulness(self, child_id: int) -> int:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO wakefulness_tracker (child_id, wake_start)
-                VALUES (?, ?)
-            ''', (child_id, get_moscow_time()))
-            conn.commit()
-            return cursor.lastrowid
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+    async def get_sleep_stats_today_cached(self, child_id: int, today_str: str):
+        """То же, что get_sleep_stats_today, но с кэшированием на STATS_CACHE_TTL секунд"""
+        return await self._cached(self._sleep_stats_cache, (child_id, today_str),
+                                  lambda key: self.get_sleep_stats_today(*key), STATS_CACHE_TTL)
     
-    def end_wakefulness(self, wake_id: int):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('SELECT wake_start FROM wakefulness_tracker WHERE id = ?', (wake_id,))
-            row = cursor.fetchone()
-            if row:
-                wake_start = datetime.fromisoformat(row[0])
+    # --- Методы для бодрствования ---
+    async def start_wakefulness(self, child_id: int) -> int:
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('''
+                    INSERT INTO wakefulness_tracker (child_id, wake_start)
+                    VALUES (?, ?)
+                    RETURNING id
+                ''', (child_id, get_moscow_time()))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                return rows[0]['id']
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def end_active_wakefulness(self, child_id: int) -> Optional[sqlite3.Row]:
+        """Завершает активное бодрствование одним запросом и возвращает завершенную запись (или None)"""
+        async with self._write_lock:
+            conn = self._conn
+            try:
                 wake_end = get_moscow_time()
-                duration = int((wake_end - wake_start).total_seconds() / 60)
-                
-                cursor.execute('''
+                cursor = await conn.execute('''
                     UPDATE wakefulness_tracker 
-                    SET wake_end = ?, duration_minutes = ?
-                    WHERE id = ?
-                ''', (wake_end, duration, wake_id))
-            
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def get_active_wakefulness(self, child_id: int) -> Optional[sqlite3.Row]:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM wakefulness_tracker 
-                WHERE child_id = ? AND wake_end IS NULL
-                ORDER BY wake_start DESC 
-                LIMIT 1
-            ''', (child_id,))
-            return cursor.fetchone()
-        finally:
-            conn.close()
-    
-    def get_wakefulness_stats_today(self, child_id: int):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
+                    SET wake_end = ?,
+                        duration_minutes = CAST(ROUND((julianday(?) - julianday(wake_start)) * 86400) AS INTEGER) / 60
+                    WHERE child_id = ? AND wake_end IS NULL
+                    RETURNING id, wake_start, wake_end, duration_minutes
+                ''', (wake_end, wake_end, child_id))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                self._invalidate_stats(self._wake_stats_cache, child_id)
+                self._invalidate_stats(self._stats_screen_cache, child_id)
+                return max(rows, key=lambda row: row['wake_start']) if rows else None
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def get_active_wakefulness(self, child_id: int) -> Optional[sqlite3.Row]:
+        cursor = await self._conn.execute('''
+            SELECT * FROM wakefulness_tracker 
+            WHERE child_id = ? AND wake_end IS NULL
+            ORDER BY wake_start DESC 
+            LIMIT 1
+        ''', (child_id,))
+        return await cursor.fetchone()
+    
+    async def get_wakefulness_stats_today(self, child_id: int, today_str: Optional[str] = None):
+        if today_str is None:
             today_str = get_moscow_time().strftime('%Y-%m-%d')
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as wake_count,
-                    SUM(duration_minutes) as total_minutes,
-                    AVG(duration_minutes) as avg_minutes
-                FROM wakefulness_tracker 
-                WHERE child_id = ? 
-                AND DATE(wake_start) = ?
-                AND wake_end IS NOT NULL
-            ''', (child_id, today_str))
-            return cursor.fetchone()
-        finally:
-            conn.close()
+        cursor = await self._conn.execute('''
+            SELECT 
+                COUNT(*) as wake_count,
+                SUM(duration_minutes) as total_minutes,
+                AVG(duration_minutes) as avg_minutes
+            FROM wakefulness_tracker 
+            WHERE child_id = ? 
+            AND DATE(wake_start) = ?
+            AND wake_end IS NOT NULL
+        ''', (child_id, today_str))
+        return await cursor.fetchone()
     
-    # --- Методы для подгузников ---
-    def add_diaper(self, child_id: int, diaper_type: str):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO diaper_tracker (child_id, type, timestamp)
-                VALUES (?, ?, ?)
-            ''', (child_id, diaper_type, get_moscow_time()))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
+    async def get_wakefulness_stats_today_cached(self, child_id: int, today_str: str):
+        """То же, что get_wakefulness_stats_today, но с кэшированием на STATS_CACHE_TTL секунд"""
+        return await self._cached(self._wake_stats_cache, (child_id, today_str),
+                                  lambda key: self.get_wakefulness_stats_today(*key), STATS_CACHE_TTL)
     
-    def get_diaper_stats_today(self, child_id: int):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
+    # --- Методы для подгузников ---
+    async def add_diaper(self, child_id: int, diaper_type: str):
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('''
+                    INSERT INTO diaper_tracker (child_id, type, timestamp)
+                    VALUES (?, ?, ?)
+                ''', (child_id, diaper_type, get_moscow_time()))
+                await conn.commit()
+                self._invalidate_stats(self._diaper_stats_cache, child_id)
+                self._invalidate_stats(self._stats_screen_cache, child_id)
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def get_diaper_stats_today(self, child_id: int, today_str: Optional[str] = None):
+        if today_str is None:
             today_str = get_moscow_time().strftime('%Y-%m-%d')
-            cursor.execute('''
-                SELECT 
-                    type,
-                    COUNT(*) as count,
-                    COUNT(CASE WHEN time(timestamp) > time('now', '-3 hours') THEN 1 END) as recent_count
-                FROM diaper_tracker 
-                WHERE child_id = ? 
-                AND DATE(timestamp) = ?
-                GROUP BY type
-            ''', (child_id, today_str))
-            return cursor.fetchall()
-        finally:
-            conn.close()
+        cursor = await self._conn.execute('''
+            SELECT 
+                type,
+                COUNT(*) as count,
+                COUNT(CASE WHEN time(timestamp) > time('now', '-3 hours') THEN 1 END) as recent_count
+            FROM diaper_tracker 
+            WHERE child_id = ? 
+            AND DATE(timestamp) = ?
+            GROUP BY type
+        ''', (child_id, today_str))
+        return await cursor.fetchall()
+    
+    async def get_diaper_stats_today_cached(self, child_id: int, today_str: str):
+        """То же, что get_diaper_stats_today, но с кэшированием на STATS_CACHE_TTL секунд"""
+        return await self._cached(self._diaper_stats_cache, (child_id, today_str),
+                                  lambda key: self.get_diaper_stats_today(*key), STATS_CACHE_TTL)
+    
+    async def get_today_summary(self, child_id: int, today_str: str) -> sqlite3.Row:
+        """Кормления, сон, бодрствование и подгузники за день одним запросом.
+        Счетчики подгузников лежат в колонках с именами ключей DIAPER_TYPES"""
+        cursor = await self._conn.execute('''
+            WITH feedings_today AS (
+                SELECT COUNT(*) AS cnt, COALESCE(SUM(total_eaten_ml), 0) AS ml
+                FROM feedings
+                WHERE child_id = :child_id AND start_time >= :today AND start_time < date(:today, '+1 day')
+            ), sleep AS (
+                SELECT COUNT(*) AS cnt, SUM(duration_minutes) AS minutes
+                FROM sleep_tracker
+                WHERE child_id = :child_id AND DATE(sleep_start) = :today AND sleep_end IS NOT NULL
+            ), wake AS (
+                SELECT COUNT(*) AS cnt, SUM(duration_minutes) AS minutes
+                FROM wakefulness_tracker
+                WHERE child_id = :child_id AND DATE(wake_start) = :today AND wake_end IS NOT NULL
+            ), diapers AS (
+                SELECT
+                    COUNT(CASE WHEN type = :diaper_urine THEN 1 END) AS diaper_urine,
+                    COUNT(CASE WHEN type = :diaper_poop THEN 1 END) AS diaper_poop,
+                    COUNT(CASE WHEN type = :diaper_both THEN 1 END) AS diaper_both
+                FROM diaper_tracker
+                WHERE child_id = :child_id AND DATE(timestamp) = :today
+            )
+            SELECT
+                feedings_today.cnt AS feedings_count, feedings_today.ml AS feedings_ml,
+                sleep.cnt AS sleep_count, sleep.minutes AS sleep_minutes,
+                wake.cnt AS wake_count, wake.minutes AS wake_minutes,
+                diapers.*
+            FROM feedings_today, sleep, wake, diapers
+        ''', {'child_id': child_id, 'today': today_str, **DIAPER_TYPES})
+        return await cursor.fetchone()
+    
+    async def get_stats_screen(self, child_id: int, today_str: str) -> Tuple[Any, Any, Any, Any]:
+        """Все данные экрана статистики: кормления за неделю, измерения, кормления за день и сводка дня"""
+        # Запросы независимы: отправляем их в очередь соединения разом
+        return tuple(await asyncio.gather(
+            self.get_weekly_feeding_stats(child_id),
+            self.get_recent_measurements(child_id),
+            self.get_today_feedings(child_id, today_str),
+            self.get_today_summary(child_id, today_str)
+        ))
+    
+    async def get_stats_screen_cached(self, child_id: int, today_str: str) -> Tuple[Any, Any, Any, Any]:
+        """То же, что get_stats_screen, но с кэшированием на STATS_CACHE_TTL секунд.
+        Сбрасывается любой записью кормления, измерения, сна, бодрствования или подгузника"""
+        return await self._cached(self._stats_screen_cache, (child_id, today_str),
+                                  lambda key: self.get_stats_screen(*key), STATS_CACHE_TTL)
     
     # --- Методы для заметок ---
-    def add_journal_note(self, child_id: int, note: str, category: str = None):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO journal_notes (child_id, note, category, created_at)
-                VALUES (?, ?, ?, ?)
-            ''', (child_id, note, category, get_moscow_time()))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def get_recent_notes(self, child_id: int, limit: int = 5):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM journal_notes 
-                WHERE child_id = ? 
-                ORDER BY created_at DESC 
-                LIMIT ?
-            ''', (child_id, limit))
-            return cursor.fetchall()
-        finally:
-            conn.close()
+    async def add_journal_note(self, child_id: int, note: str, category: str = None):
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('''
+                    INSERT INTO journal_notes (child_id, note, category, created_at)
+                    VALUES (?, ?, ?, ?)
+                ''', (child_id, note, category, get_moscow_time()))
+                await conn.commit()
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def get_recent_notes(self, child_id: int, limit: int = 5):
+        cursor = await self._conn.execute('''
+            SELECT * FROM journal_notes 
+            WHERE child_id = ? 
+            ORDER BY created_at DESC 
+            LIMIT ?
+        ''', (child_id, limit))
+        return await cursor.fetchall()
     
     # --- Методы для кормлений ---
-    def get_daily_feeding_stats(self, child_id: int):
+    async def get_weekly_feeding_stats(self, child_id: int) -> List[sqlite3.Row]:
+        """Количество кормлений и объём по дням за последние 7 дней (по МСК)"""
+        # Итоги уже посчитаны триггерами: читаем не больше восьми строк по первичному ключу
+        week_start = (get_moscow_time().date() - timedelta(days=7)).strftime('%Y-%m-%d')
+        cursor = await self._conn.execute('''
+            SELECT feeding_date, feedings_count, total_ml
+            FROM feeding_daily
+            WHERE child_id = ? 
+            AND feeding_date >= ?
+            ORDER BY feeding_date DESC
+        ''', (child_id, week_start))
+        return await cursor.fetchall()
+
+    async def get_daily_feeding_stats(self, child_id: int, today_str: Optional[str] = None):
         """Возвращает количество кормлений и суммарный объём за сегодня (по МСК)"""
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
+        if today_str is None:
             today_str = get_moscow_time().strftime('%Y-%m-%d')
-            cursor.execute('''
-                SELECT 
-                    COUNT(*) as feedings_count,
-                    COALESCE(SUM(total_eaten_ml), 0) as total_ml
-                FROM feedings 
-                WHERE child_id = ? 
-                AND DATE(start_time) = ?
-            ''', (child_id, today_str))
-            return cursor.fetchone()
-        finally:
-            conn.close()
-
-    def get_today_feedings(self, child_id: int):
+        cursor = await self._conn.execute('''
+            SELECT 
+                COUNT(*) as feedings_count,
+                COALESCE(SUM(total_eaten_ml), 0) as total_ml
+            FROM feedings 
+            WHERE child_id = :child_id 
+            AND start_time >= :today AND start_time < date(:today, '+1 day')
+        ''', {'child_id': child_id, 'today': today_str})
+        return await cursor.fetchone()
+
+    async def get_today_feedings(self, child_id: int, today_str: Optional[str] = None):
         """Возвращает список кормлений за сегодня с временем и объёмом"""
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
+        if today_str is None:
             today_str = get_moscow_time().strftime('%Y-%m-%d')
-            cursor.execute('''
-                SELECT 
-                    time(start_time) as start_time,
-                    time(end_time) as end_time,
-                    total_eaten_ml
-                FROM feedings 
-                WHERE child_id = ? 
-                AND DATE(start_time) = ?
-                AND end_time IS NOT NULL
-                ORDER BY start_time ASC
-            ''', (child_id, today_str))
-            return cursor.fetchall()
-        finally:
-            conn.close()
-    
-    def start_feeding(self, chat_id: int, child_id: int) -> int:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO feedings (chat_id, child_id, start_time)
-                VALUES (?, ?, ?)
-            ''', (chat_id, child_id, get_moscow_time()))
-            conn.commit()
-            return cursor.lastrowid
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def add_eaten_ml(self, feeding_id: int, eaten_ml: int):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE feedings 
-                SET total_eaten_ml = COALESCE(total_eaten_ml, 0) + ?
-                WHERE id = ?
-            ''', (eaten_ml, feeding_id))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def finish_feeding(self, feeding_id: int):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE feedings 
-                SET end_time = ?
-                WHERE id = ?
-            ''', (get_moscow_time(), feeding_id))
-            conn.commit()
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def get_active_feeding(self, chat_id: int) -> Optional[sqlite3.Row]:
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM feedings 
-                WHERE chat_id = ? AND end_time IS NULL
-                ORDER BY start_time DESC 
-                LIMIT 1
-            ''', (chat_id,))
-            return cursor.fetchone()
-        finally:
-            conn.close()
-    
-    def delete_active_feeding(self, chat_id: int):
+        cursor = await self._conn.execute('''
+            SELECT 
+                time(start_time) as start_time,
+                time(end_time) as end_time,
+                total_eaten_ml
+            FROM feedings 
+            WHERE child_id = :child_id 
+            AND start_time >= :today AND start_time < date(:today, '+1 day')
+            AND end_time IS NOT NULL
+            ORDER BY start_time ASC
+        ''', {'child_id': child_id, 'today': today_str})
+        return await cursor.fetchall()
+    
+    async def start_feeding(self, chat_id: int, child_id: int) -> int:
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('''
+                    INSERT INTO feedings (chat_id, child_id, start_time)
+                    VALUES (?, ?, ?)
+                    RETURNING id
+                ''', (chat_id, child_id, get_moscow_time()))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                self._invalidate_stats(self._stats_screen_cache, child_id)
+                return rows[0]['id']
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def add_eaten_ml(self, feeding_id: int, eaten_ml: int):
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('''
+                    UPDATE feedings 
+                    SET total_eaten_ml = COALESCE(total_eaten_ml, 0) + ?
+                    WHERE id = ?
+                    RETURNING child_id
+                ''', (eaten_ml, feeding_id))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                for row in rows:
+                    self._invalidate_stats(self._stats_screen_cache, row['child_id'])
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def finish_feeding(self, feeding_id: int) -> Optional[sqlite3.Row]:
+        """Завершает кормление и возвращает начало, конец и длительность в секундах без пауз"""
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('''
+                    UPDATE feedings 
+                    SET end_time = ?
+                    WHERE id = ?
+                    RETURNING child_id, start_time, end_time,
+                        CAST(ROUND((julianday(end_time) - julianday(start_time)) * 86400) AS INTEGER)
+                            - COALESCE(total_pause_duration, 0) AS duration_seconds
+                ''', (get_moscow_time(), feeding_id))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                for row in rows:
+                    self._invalidate_stats(self._stats_screen_cache, row['child_id'])
+                return rows[0] if rows else None
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def get_active_feeding(self, chat_id: int) -> Optional[sqlite3.Row]:
+        cursor = await self._conn.execute('''
+            SELECT * FROM feedings 
+            WHERE chat_id = ? AND end_time IS NULL
+            ORDER BY start_time DESC 
+            LIMIT 1
+        ''', (chat_id,))
+        return await cursor.fetchone()
+    
+    async def delete_active_feeding(self, chat_id: int):
         """Удаляет активное кормление (защита от багов)"""
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                DELETE FROM feedings 
-                WHERE chat_id = ? AND end_time IS NULL
-            ''', (chat_id,))
-            conn.commit()
-            return cursor.rowcount
-        except Exception as e:
-            conn.rollback()
-            raise e
-        finally:
-            conn.close()
-    
-    def get_reminders_due(self):
-        conn = self.get_connection()
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT r.*, c.first_name, c.chat_id 
-                FROM reminders r
-                JOIN children c ON r.child_id = c.id
-                WHERE r.next_reminder <= date('now') 
-                AND r.is_active = 1
-            ''')
-            return cursor.fetchall()
-        finally:
-            conn.close()
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('''
+                    DELETE FROM feedings 
+                    WHERE chat_id = ? AND end_time IS NULL
+                    RETURNING child_id
+                ''', (chat_id,))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                for row in rows:
+                    self._invalidate_stats(self._stats_screen_cache, row['child_id'])
+                return len(rows)
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def delete_feeding(self, feeding_id: int):
+        async with self._write_lock:
+            conn = self._conn
+            try:
+                cursor = await conn.execute('DELETE FROM feedings WHERE id = ? RETURNING child_id', (feeding_id,))
+                rows = await cursor.fetchall()
+                await conn.commit()
+                for row in rows:
+                    self._invalidate_stats(self._stats_screen_cache, row['child_id'])
+            except Exception as e:
+                await conn.rollback()
+                raise e
+    
+    async def get_reminders_due(self, today: date):
+        """Напоминания на дату today вместе с именем ребенка и его возрастом в днях (age_days)"""
+        today_str = today.strftime('%Y-%m-%d')
+        cursor = await self._conn.execute('''
+            SELECT r.*, c.first_name, c.birth_date, c.chat_id,
+                CAST(julianday(?) - julianday(c.birth_date) AS INTEGER) AS age_days
+            FROM reminders r
+            JOIN children c ON r.child_id = c.id
+            WHERE r.next_reminder <= ? 
+            AND r.is_active = 1
+        ''', (today_str, today_str))
+        return await cursor.fetchall()
+    
+    async def get_next_reminder_date(self) -> Optional[date]:
+        """Ближайшая дата активного напоминания или None, если напоминаний нет"""
+        cursor = await self._conn.execute('''
+            SELECT MIN(next_reminder) AS next_reminder FROM reminders WHERE is_active = 1
+        ''')
+        row = await cursor.fetchone()
+        return date.fromisoformat(row['next_reminder']) if row['next_reminder'] else None
 
 db = Database()
 
-# --- Глобальные переменные ---
-active_feedings = {}
-
 # --- Вспомогательные функции ---
 def get_moscow_time() -> datetime:
     """Возвращает наивное (без часового пояса) московское время"""
     return datetime.now(MOSCOW_TZ).replace(tzinfo=None)
 
+def parse_number(text: Optional[str]) -> Optional[int]:
+    """Целое неотрицательное число из текста сообщения или None, если это не число"""
+    if text is None:
+        return None
+    text = text.strip()
+    return int(text) if text.isdecimal() else None
+
+def parse_float(text: Optional[str]) -> Optional[float]:
+    """Неотрицательное число, в том числе дробное, из текста сообщения или None, если это не число.
+    Дробную часть можно отделить точкой или запятой"""
+    if text is None:
+        return None
+    text = text.strip().replace(',', '.', 1)
+    return float(text) if text.replace('.', '', 1).isdecimal() else None
+
+async def edit_text_if_changed(message: Message, text: str,
+                               reply_markup: Optional[types.InlineKeyboardMarkup] = None):
+    """Редактирует сообщение, только если текст или клавиатура действительно изменились"""
+    # Telegram обрезает пробельные символы по краям, поэтому сравниваем без них
+    if message.text == text.strip() and message.reply_markup == reply_markup:
+        return
+    try:
+        await message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+
+def full_name(person: Dict[str, Any]) -> str:
+    """Имя и фамилия через пробел; без лишнего пробела, если фамилии нет"""
+    if person['last_name']:
+        return f"{person['first_name']} {person['last_name']}"
+    return person['first_name']
+
+def child_header(child: Dict[str, Any], now: datetime) -> str:
+    """Строки с именем ребенка и текущей датой для шапки экранов"""
+    return f"👶 Ребенок: {child['first_name']}\n📅 Дата: {now:%d.%m.%Y}\n"
+
+def split_into_messages(parts: List[str], limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Склеивает части текста в сообщения, каждое не длиннее limit символов"""
+    messages = []
+    current = []
+    current_len = 0
+    for part in parts:
+        if current and current_len + len(part) > limit:
+            messages.append("".join(current))
+            current = []
+            current_len = 0
+        current.append(part)
+        current_len += len(part)
+    messages.append("".join(current))
+    return messages
+
 def format_duration(seconds: int) -> str:
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
+    hours, rest = divmod(seconds, 3600)
+    minutes = rest // 60
     if hours > 0:
         return f"{hours}ч {minutes}мин"
     return f"{minutes}мин"
 
-def calculate_age(birth_date: datetime) -> Tuple[int, int, int]:
-    today = get_moscow_time().date()
-    birth = birth_date.date()
-    
-    years = today.year - birth.year
-    months = today.month - birth.month
-    days = today.day - birth.day
-    
-    if days < 0:
+def _age_parts(birth_y: int, birth_m: int, birth_d: int,
+               today_y: int, today_m: int, today_d: int) -> Tuple[int, int, int]:
+    """Возраст (лет, месяцев, дней) на целых числах, без объектов даты.
+    Месяц отсчитывается от дня рождения, а в коротких месяцах — от последнего дня"""
+    months = (today_y - birth_y) * 12 + today_m - birth_m
+    anchor_d = min(birth_d, calendar.monthrange(today_y, today_m)[1])
+    if today_d >= anchor_d:
+        days = today_d - anchor_d
+    else:
+        # Месяц еще не исполнился: считаем дни от "дня рождения" в прошлом месяце
         months -= 1
-        if today.month == 1:
-            last_month = 12
-            last_year = today.year - 1
-        else:
-            last_month = today.month - 1
-            last_year = today.year
-        days_in_last_month = (datetime(last_year, last_month % 12 + 1, 1) - 
-                             timedelta(days=1)).day
-        days = days_in_last_month + days
-    
-    if months < 0:
-        years -= 1
-        months = 12 + months
-    
+        prev_y, prev_m = (today_y - 1, 12) if today_m == 1 else (today_y, today_m - 1)
+        prev_len = calendar.monthrange(prev_y, prev_m)[1]
+        days = prev_len - min(birth_d, prev_len) + today_d
+    years, months = divmod(months, 12)
     return years, months, days
 
+@lru_cache(maxsize=4096)
+def calculate_age(birth: date, today: date) -> Tuple[int, int, int]:
+    """Возраст (лет, месяцев, дней) по дате рождения на дату today"""
+    return _age_parts(birth.year, birth.month, birth.day, today.year, today.month, today.day)
+
 def calculate_formula(weight_kg: float, age_days: int) -> Dict:
     """Рассчитать суточный объем смеси"""
     if age_days <= 10:
@@ -714,589 +1035,607 @@ def calculate_formula(weight_kg: float, age_days: int) -> Dict:
         "feedings": feedings_per_day
     }
 
-# --- Клавиатуры ---
-def get_main_menu_keyboard() -> types.InlineKeyboardMarkup:
-    """Главное меню"""
-    keyboard = [
-        [
-            types.InlineKeyboardButton(text="👶 Инфо о ребенке", callback_data="child_info"),
-            types.InlineKeyboardButton(text="📊 Параметры", callback_data="update_params")
-        ],
-        [
-            types.InlineKeyboardButton(text="🍼 Кормление", callback_data="start_feeding"),
-            types.InlineKeyboardButton(text="💤 Сон", callback_data="sleep_menu")
-        ],
-        [
-            types.InlineKeyboardButton(text="🩲 Подгузник", callback_data="diaper_menu"),
-            types.InlineKeyboardButton(text="📝 Заметка", callback_data="note_menu")
-        ],
-        [
-            types.InlineKeyboardButton(text="📈 Статистика", callback_data="show_stats"),
-        ],
-        [
-            types.InlineKeyboardButton(text="🔄 Сбросить активное кормление", callback_data="reset_active_feeding")
-        ]
-    ]
-    return types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-def get_feeding_control_keyboard() -> types.InlineKeyboardMarkup:
-    """Клавиатура управления кормлением"""
-    keyboard = [
-        [
-            types.InlineKeyboardButton(text="➕ 5 мл", callback_data="add_5"),
-            types.InlineKeyboardButton(text="➕ 10 мл", callback_data="add_10"),
-            types.InlineKeyboardButton(text="➕ 20 мл", callback_data="add_20")
-        ],
-        [
-            types.InlineKeyboardButton(text="➕ 30 мл", callback_data="add_30"),
-            types.InlineKeyboardButton(text="➕ 50 мл", callback_data="add_50"),
-            types.InlineKeyboardButton(text="➕ 100 мл", callback_data="add_100")
-        ],
-        [
-            types.InlineKeyboardButton(text="📝 Ввести своё количество", callback_data="add_custom")
-        ],
-        [
-            types.InlineKeyboardButton(text="✅ Завершить", callback_data="finish_feeding"),
-            types.InlineKeyboardButton(text="❌ Отменить", callback_data="cancel_feeding")
-        ],
-        [
-            types.InlineKeyboardButton(text="🔙 В главное меню", callback_data="main_menu")
-        ]
-    ]
-    return types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-def get_sleep_menu_keyboard() -> types.InlineKeyboardMarkup:
-    """Меню отслеживания сна"""
-    keyboard = [
-        [
-            types.InlineKeyboardButton(text="🛏️ Начало сна", callback_data="start_sleep"),
-            types.InlineKeyboardButton(text="🌅 Конец сна", callback_data="end_sleep")
-        ],
-        [
-            types.InlineKeyboardButton(text="📊 Статистика сна", callback_data="sleep_stats"),
-            types.InlineKeyboardButton(text="🌞 Бодрствование", callback_data="wake_menu")
-        ],
-        [
-            types.InlineKeyboardButton(text="🔙 В главное меню", callback_data="main_menu")
-        ]
-    ]
-    return types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-def get_wake_menu_keyboard() -> types.InlineKeyboardMarkup:
-    """Меню отслеживания бодрствования"""
-    keyboard = [
-        [
-            types.InlineKeyboardButton(text="🌞 Начало бодрствования", callback_data="start_wake"),
-            types.InlineKeyboardButton(text="🌜 Конец бодрствования", callback_data="end_wake")
-        ],
-        [
-            types.InlineKeyboardButton(text="📊 Статистика бодрствования", callback_data="wake_stats")
-        ],
-        [
-            types.InlineKeyboardButton(text="🔙 Назад к меню сна", callback_data="sleep_menu")
-        ]
-    ]
-    return types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-def get_diaper_menu_keyboard() -> types.InlineKeyboardMarkup:
-    """Меню отслеживания подгузников"""
-    keyboard = [
-        [
-            types.InlineKeyboardButton(text="💦 Мочеиспускание", callback_data="diaper_urine"),
-            types.InlineKeyboardButton(text="💩 Стул", callback_data="diaper_poop")
-        ],
-        [
-            types.InlineKeyboardButton(text="💦💩 Оба", callback_data="diaper_both"),
-            types.InlineKeyboardButton(text="📊 Статистика", callback_data="diaper_stats")
-        ],
-        [
-            types.InlineKeyboardButton(text="🔙 В главное меню", callback_data="main_menu")
-        ]
-    ]
-    return types.InlineKeyboardMarkup(inline_keyboard=keyboard)
-
-def get_gender_keyboard() -> types.InlineKeyboardMarkup:
-    """Клавиатура выбора пола"""
-    keyboard = [
-        [
-            types.InlineKeyboardButton(text="👦 Мальчик", callback_data="gender_m"),
-            types.InlineKeyboardButton(text="👧 Девочка", callback_data="gender_f")
-        ]
-    ]
-    return types.InlineKeyboardMarkup(inline_keyboard=keyboard)
+# --- Шаблоны сообщений ---
+CHILD_INFO_TEMPLATE = (
+    "👶 Информация о ребенке\n\n"
+    "👶 Ребенок: {full_name}\n"
+    "🚻 Пол: {gender}\n"
+    "📅 Дата рождения: {birth_date}\n"
+    "🎂 Возраст: {years} лет, {months} месяцев, {days} дней\n"
+    "🤰 Срок беременности: {gestation_weeks} нед. {gestation_days} дн.\n"
+    "⚖️ Вес при рождении: {birth_weight} г\n"
+    "📏 Рост при рождении: {birth_height} см\n"
+).format
+
+LAST_MEASUREMENT_TEMPLATE = (
+    "\n📊 Последние измерения:\n"
+    "⚖️ Вес: {weight} г (+{weight_gain} г)\n"
+    "📏 Рост: {height} см (+{height_gain} см)\n"
+    "📅 Дата: {measurement_date}\n"
+    "🎂 Возраст на момент измерения: {age_days} дней"
+).format
+
+REGISTERED_TEMPLATE = (
+    "✅ Ребенок успешно зарегистрирован!\n\n"
+    "👶 Имя: {full_name}\n"
+    "🚻 Пол: {gender}\n"
+    "📅 Дата рождения: {birth_date}\n"
+    "🎂 Возраст: {years} лет, {months} месяцев, {days} дней\n"
+    "🤰 Срок беременности: {gestation_weeks} недель {gestation_days} дней\n"
+    "⚖️ Вес при рождении: {birth_weight} г\n"
+    "📏 Рост при рождении: {birth_height} см\n\n"
+    "Теперь вы можете начать отслеживать кормления и параметры развития."
+).format
+
+UPDATE_PARAMS_TEMPLATE = (
+    "📊 Внесение параметров\n\n"
+    "👶 Ребенок: {first_name}\n\n"
+    "Введите текущий вес ребенка в граммах (например: 4500):\n\n"
+    "Для отмены нажмите ❌ Отмена"
+).format
+
+STATS_HEADER_TEMPLATE = "📊 Статистика для {first_name}\n\n".format
+
+REMINDER_TEMPLATE = (
+    "🔔 Напоминание для {first_name}\n\n"
+    "Пора измерить параметры развития ребенка!\n"
+    "📅 Возраст: {age_days} дней\n"
+    "📋 Рекомендуемая частота: {frequency}\n\n"
+    "Используйте кнопку '📊 Параметры' для внесения данных."
+).format
+
+HELP_TEXT = """📋 Доступные команды и функции:
 
-def get_cancel_keyboard() -> types.InlineKeyboardMarkup:
-    """Клавиатура с кнопкой отмены"""
-    keyboard = [
-        [
-            types.InlineKeyboardButton(text="❌ Отмена", callback_data="cancel_state")
-        ]
-    ]
-    return types.InlineKeyboardMarkup(inline_keyboard=keyboard)
+Основные:
+/start - Главное меню
+/register - Регистрация ребенка
+/child_info - Информация о ребенке
+/params - Внести параметры роста/веса
+/stats - Статистика развития
+/menu - Главное меню (inline)
+/help - Справка
+
+Функции для родителей:
+• 💤 Сон - Трекер сна
+• 🌞 Бодрствование - Трекер времени бодрствования
+• 🩲 Подгузник - Трекер смены подгузников
+• 📝 Заметка - Журнал для записей
+
+Для кормлений:
+/feeding - Начать кормление
+/add_eaten [количество] - Добавить съеденное (например: /add_eaten 50)
+/finish - Завершить кормление
+/reset_feeding - Сбросить активное кормление (при багах)
+
+Для отмены ввода:
+/cancel - Отмена текущего действия"""
+
+def with_main_menu(text: str) -> str:
+    """Дописывает к ответу приглашение главного меню, чтобы отправить всё одним сообщением"""
+    return text.rstrip() + "\n\n🏠 Главное меню\nВыберите раздел:"
+
+async def format_child_info(child: Dict[str, Any]) -> str:
+    """Текст карточки ребенка с последними измерениями"""
+    last_measurement = await db.get_last_measurement_cached(child['id'])
+    years, months, days = calculate_age(child['_birth_date'], get_moscow_time().date())
+    text = CHILD_INFO_TEMPLATE(
+        full_name=child['_full_name'],
+        gender=child['gender'],
+        birth_date=child['birth_date'],
+        years=years, months=months, days=days,
+        gestation_weeks=child['gestation_weeks'],
+        gestation_days=child['gestation_days'],
+        birth_weight=child['birth_weight'],
+        birth_height=child['birth_height']
+    )
+    
+    if last_measurement:
+        text += LAST_MEASUREMENT_TEMPLATE(
+            weight=last_measurement['weight'],
+            weight_gain=last_measurement['weight_gain'],
+            height=last_measurement['height'],
+            height_gain=last_measurement['height_gain'],
+            measurement_date=last_measurement['measurement_date'],
+            age_days=last_measurement['age_days']
+        )
+    
+    return text
+
+# --- Подгузники ---
+# Тип подгузника по callback-данным кнопки
+DIAPER_TYPES = {
+    "diaper_urine": "мочеиспускание",
+    "diaper_poop": "стул",
+    "diaper_both": "оба"
+}
+DIAPER_EMOJI = {"мочеиспускание": "💦", "стул": "💩", "оба": "💦💩"}
+
+# --- Клавиатуры ---
+# Раскладки клавиатур: строки кнопок из пар (текст, callback_data)
+KEYBOARD_LAYOUTS = {
+    "main_menu": (
+        (("👶 Инфо о ребенке", "child_info"), ("📊 Параметры", "update_params")),
+        (("🍼 Кормление", "start_feeding"), ("💤 Сон", "sleep_menu")),
+        (("🩲 Подгузник", "diaper_menu"), ("📝 Заметка", "note_menu")),
+        (("📈 Статистика", "show_stats"),),
+        (("🔄 Сбросить активное кормление", "reset_active_feeding"),),
+    ),
+    "feeding_control": (
+        tuple((f"➕ {ml} мл", AddEatenCallback(ml=ml).pack()) for ml in (5, 10, 20)),
+        tuple((f"➕ {ml} мл", AddEatenCallback(ml=ml).pack()) for ml in (30, 50, 100)),
+        (("📝 Ввести своё количество", "add_custom"),),
+        (("✅ Завершить", "finish_feeding"), ("❌ Отменить", "cancel_feeding")),
+        (("🔙 В главное меню", "main_menu"),),
+    ),
+    "sleep_menu": (
+        (("🛏️ Начало сна", "start_sleep"), ("🌅 Конец сна", "end_sleep")),
+        (("📊 Статистика сна", "sleep_stats"), ("🌞 Бодрствование", "wake_menu")),
+        (("🔙 В главное меню", "main_menu"),),
+    ),
+    "wake_menu": (
+        (("🌞 Начало бодрствования", "start_wake"), ("🌜 Конец бодрствования", "end_wake")),
+        (("📊 Статистика бодрствования", "wake_stats"),),
+        (("🔙 Назад к меню сна", "sleep_menu"),),
+    ),
+    "diaper_menu": (
+        (("💦 Мочеиспускание", "diaper_urine"), ("💩 Стул", "diaper_poop")),
+        (("💦💩 Оба", "diaper_both"), ("📊 Статистика", "diaper_stats")),
+        (("🔙 В главное меню", "main_menu"),),
+    ),
+    "gender": (
+        (("👦 Мальчик", "gender_m"), ("👧 Девочка", "gender_f")),
+    ),
+    "cancel": (
+        (("❌ Отмена", "cancel_state"),),
+    ),
+    "main_menu_inline": (
+        (("🏠 В главное меню", "main_menu"),),
+    ),
+}
+
+@lru_cache(maxsize=None)
+def get_keyboard(name: str) -> types.InlineKeyboardMarkup:
+    """Клавиатура по имени раскладки; собирается при первом обращении и дальше переиспользуется"""
+    return types.InlineKeyboardMarkup(inline_keyboard=[
+        [types.InlineKeyboardButton(text=text, callback_data=data) for text, data in row]
+        for row in KEYBOARD_LAYOUTS[name]
+    ])
+
+# --- Middleware ---
+class ChildMiddleware(BaseMiddleware):
+    """Передает обработчикам ребенка текущего чата в аргументе child"""
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        message = event.message if isinstance(event, CallbackQuery) else event
+        data['child'] = await db.get_child_cached(message.chat.id)
+        return await handler(event, data)
+
+# Внутренние middleware вызываются только для подошедшего обработчика
+router.message.middleware(ChildMiddleware())
+router.callback_query.middleware(ChildMiddleware())
+
+# --- Таблица обработчиков кнопок ---
+# Кнопки с постоянным callback_data разбираем одним обработчиком через словарь,
+# а не перебором фильтров F.data == ... по всем обработчикам роутера
+CALLBACK_HANDLERS: Dict[str, Tuple[Callable[..., Awaitable[Any]], frozenset]] = {}
+
+def callback_handler(data: str):
+    """Регистрирует обработчик кнопки с callback_data == data"""
+    def decorator(func):
+        # Запоминаем имена аргументов, чтобы передавать обработчику только нужные
+        CALLBACK_HANDLERS[data] = (func, frozenset(inspect.signature(func).parameters))
+        return func
+    return decorator
+
+@router.callback_query(F.data.in_(CALLBACK_HANDLERS))
+async def dispatch_callback(callback: CallbackQuery, state: FSMContext, child: Optional[Dict[str, Any]]):
+    """Вызывает обработчик нажатой кнопки из CALLBACK_HANDLERS"""
+    handler, params = CALLBACK_HANDLERS[callback.data]
+    extra = {'state': state, 'child': child}
+    await handler(callback, **{name: value for name, value in extra.items() if name in params})
 
 # --- Обработчики ---
-@router.callback_query(F.data == "main_menu")
-async def main_menu_callback(callback: CallbackQuery):
+@callback_handler("main_menu")
+async def main_menu_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Возврат в главное меню"""
-    child = db.get_child(callback.message.chat.id)
     
     text = "🏠 Главное меню\n\n"
     if child:
-        years, months, days = calculate_age(datetime.strptime(child['birth_date'], "%Y-%m-%d"))
-        text += f"👶 Ребенок: {child['first_name']} {child['last_name'] if child['last_name'] else ''}\n"
+        years, months, days = calculate_age(child['_birth_date'], get_moscow_time().date())
+        text += f"👶 Ребенок: {child['_full_name']}\n"
         text += f"📅 Возраст: {years} лет, {months} месяцев, {days} дней\n\n"
     
     text += "Выберите раздел:"
     
     if callback.message.text:
-        await callback.message.edit_text(text, reply_markup=get_main_menu_keyboard())
+        await edit_text_if_changed(callback.message, text, reply_markup=get_keyboard("main_menu"))
     else:
-        await callback.message.answer(text, reply_markup=get_main_menu_keyboard())
+        await callback.message.answer(text, reply_markup=get_keyboard("main_menu"))
     await callback.answer()
 
-@router.callback_query(F.data == "reset_active_feeding")
-async def reset_active_feeding_callback(callback: CallbackQuery):
+@callback_handler("reset_active_feeding")
+async def reset_active_feeding_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Сброс активного кормления (защита от багов)"""
     chat_id = callback.message.chat.id
-    deleted_count = db.delete_active_feeding(chat_id)
+    deleted_count = await db.delete_active_feeding(chat_id)
     
     if deleted_count > 0:
         await callback.answer(f"✅ Удалено {deleted_count} активных кормлений", show_alert=True)
     else:
         await callback.answer("⚠️ Активных кормлений не найдено", show_alert=True)
     
-    await main_menu_callback(callback)
+    await main_menu_callback(callback, child)
 
-@router.callback_query(F.data == "cancel_state")
+@callback_handler("cancel_state")
 async def cancel_state_callback(callback: CallbackQuery, state: FSMContext):
     """Отмена текущего состояния"""
     await state.clear()
-    await callback.message.edit_text(
+    await edit_text_if_changed(
+        callback.message,
         "❌ Ввод отменен",
-        reply_markup=get_main_menu_keyboard()
+        reply_markup=get_keyboard("main_menu")
     )
     await callback.answer("Ввод отменен")
 
 # --- Обработчики сна ---
-@router.callback_query(F.data == "sleep_menu")
-async def sleep_menu_callback(callback: CallbackQuery):
+@callback_handler("sleep_menu")
+async def sleep_menu_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Меню сна"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка с помощью /register", show_alert=True)
         return
     
-    await callback.message.edit_text(
+    await edit_text_if_changed(
+        callback.message,
         f"💤 Отслеживание сна и бодрствования\n\n"
-        f"👶 Ребенок: {child['first_name']}\n"
-        f"📅 Дата: {get_moscow_time().strftime('%d.%m.%Y')}\n\n"
+        f"{child_header(child, get_moscow_time())}\n"
         "Выберите действие:",
-        reply_markup=get_sleep_menu_keyboard()
+        reply_markup=get_keyboard("sleep_menu")
     )
     await callback.answer()
 
-@router.callback_query(F.data == "start_sleep")
-async def start_sleep_callback(callback: CallbackQuery):
+@callback_handler("start_sleep")
+async def start_sleep_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Начало сна"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    active_sleep = db.get_active_sleep(child['id'])
+    active_sleep = await db.get_active_sleep(child['id'])
     if active_sleep:
         await callback.answer("Уже есть активный сон! Сначала завершите его.", show_alert=True)
         return
     
-    active_wake = db.get_active_wakefulness(child['id'])
-    if active_wake:
-        db.end_wakefulness(active_wake['id'])
+    await db.end_active_wakefulness(child['id'])
     
-    sleep_id = db.start_sleep(child['id'])
+    sleep_id = await db.start_sleep(child['id'])
     
     current_time = get_moscow_time().strftime("%H:%M")
     await callback.message.edit_text(
         f"🛏️ Сон начат в {current_time}\n"
         f"👶 Для: {child['first_name']}\n\n"
         "Когда ребенок проснется, нажмите '🌅 Конец сна'",
-        reply_markup=get_sleep_menu_keyboard()
+        reply_markup=get_keyboard("sleep_menu")
     )
     await callback.answer()
 
-@router.callback_query(F.data == "end_sleep")
-async def end_sleep_callback(callback: CallbackQuery):
+@callback_handler("end_sleep")
+async def end_sleep_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Конец сна"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    active_sleep = db.get_active_sleep(child['id'])
-    if not active_sleep:
+    ended_sleep = await db.end_active_sleep(child['id'])
+    if not ended_sleep:
         await callback.answer("Нет активного сна!", show_alert=True)
         return
     
-    db.end_sleep(active_sleep['id'])
+    duration = ended_sleep['duration_minutes']
     
-    sleep_start = datetime.fromisoformat(active_sleep['sleep_start'])
-    sleep_end = get_moscow_time()
-    duration = int((sleep_end - sleep_start).total_seconds() / 60)
-    
-    hours = duration // 60
-    minutes = duration % 60
+    hours, minutes = divmod(duration, 60)
     
     await callback.message.edit_text(
         f"🌅 Сон завершен!\n"
         f"👶 Для: {child['first_name']}\n"
-        f"🛏️ Начало: {sleep_start.strftime('%H:%M')}\n"
-        f"🌅 Конец: {sleep_end.strftime('%H:%M')}\n"
+        f"🛏️ Начало: {ended_sleep['sleep_start'][11:16]}\n"
+        f"🌅 Конец: {ended_sleep['sleep_end'][11:16]}\n"
         f"⏱️ Длительность: {hours}ч {minutes}мин\n\n"
         f"✅ Отлично!",
-        reply_markup=get_sleep_menu_keyboard()
+        reply_markup=get_keyboard("sleep_menu")
     )
     await callback.answer()
 
-@router.callback_query(F.data == "sleep_stats")
-async def sleep_stats_callback(callback: CallbackQuery):
+@callback_handler("sleep_stats")
+async def sleep_stats_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Статистика сна"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    stats = db.get_sleep_stats_today(child['id'])
+    now = get_moscow_time()
+    stats = await db.get_sleep_stats_today_cached(child['id'], now.strftime('%Y-%m-%d'))
     
     if stats and stats['sleep_count'] > 0:
-        total_hours = stats['total_minutes'] // 60
-        total_minutes = stats['total_minutes'] % 60
-        avg_hours = stats['avg_minutes'] // 60
-        avg_minutes = stats['avg_minutes'] % 60
+        total_hours, total_minutes = divmod(stats['total_minutes'], 60)
+        avg_hours, avg_minutes = divmod(stats['avg_minutes'], 60)
         
-        text = f"📊 Статистика сна за сегодня:\n\n"
-        text += f"👶 Ребенок: {child['first_name']}\n"
-        text += f"📅 Дата: {get_moscow_time().strftime('%d.%m.%Y')}\n"
-        text += f"🛏️ Количество снов: {stats['sleep_count']}\n"
-        text += f"⏱️ Общее время сна: {total_hours}ч {total_minutes}мин\n"
-        text += f"📈 Средняя длительность: {avg_hours}ч {avg_minutes}мин\n\n"
+        text = (
+            f"📊 Статистика сна за сегодня:\n\n"
+            f"{child_header(child, now)}"
+            f"🛏️ Количество снов: {stats['sleep_count']}\n"
+            f"⏱️ Общее время сна: {total_hours}ч {total_minutes}мин\n"
+            f"📈 Средняя длительность: {avg_hours}ч {avg_minutes}мин\n\n"
+        )
     else:
         text = "📊 Статистика сна за сегодня:\n\n😴 Данных о сне за сегодня пока нет"
     
-    await callback.message.edit_text(
+    await edit_text_if_changed(
+        callback.message,
         text,
-        reply_markup=get_sleep_menu_keyboard()
+        reply_markup=get_keyboard("sleep_menu")
     )
     await callback.answer()
 
 # --- Обработчики бодрствования ---
-@router.callback_query(F.data == "wake_menu")
-async def wake_menu_callback(callback: CallbackQuery):
+@callback_handler("wake_menu")
+async def wake_menu_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Меню бодрствования"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    await callback.message.edit_text(
+    await edit_text_if_changed(
+        callback.message,
         f"🌞 Отслеживание бодрствования\n\n"
-        f"👶 Ребенок: {child['first_name']}\n"
-        f"📅 Дата: {get_moscow_time().strftime('%d.%m.%Y')}\n\n"
+        f"{child_header(child, get_moscow_time())}\n"
         "Выберите действие:",
-        reply_markup=get_wake_menu_keyboard()
+        reply_markup=get_keyboard("wake_menu")
     )
     await callback.answer()
 
-@router.callback_query(F.data == "start_wake")
-async def start_wake_callback(callback: CallbackQuery):
+@callback_handler("start_wake")
+async def start_wake_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Начало бодрствования"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    active_wake = db.get_active_wakefulness(child['id'])
+    active_wake = await db.get_active_wakefulness(child['id'])
     if active_wake:
         await callback.answer("Уже есть активное бодрствование!", show_alert=True)
         return
     
-    active_sleep = db.get_active_sleep(child['id'])
-    if active_sleep:
-        db.end_sleep(active_sleep['id'])
+    await db.end_active_sleep(child['id'])
     
-    wake_id = db.start_wakefulness(child['id'])
+    wake_id = await db.start_wakefulness(child['id'])
     
     current_time = get_moscow_time().strftime("%H:%M")
     await callback.message.edit_text(
         f"🌞 Бодрствование начато в {current_time}\n"
         f"👶 Для: {child['first_name']}\n\n"
         "Когда ребенок начнет засыпать, нажмите '🌜 Конец бодрствования'",
-        reply_markup=get_wake_menu_keyboard()
+        reply_markup=get_keyboard("wake_menu")
     )
     await callback.answer()
 
-@router.callback_query(F.data == "end_wake")
-async def end_wake_callback(callback: CallbackQuery):
+@callback_handler("end_wake")
+async def end_wake_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Конец бодрствования"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    active_wake = db.get_active_wakefulness(child['id'])
-    if not active_wake:
+    ended_wake = await db.end_active_wakefulness(child['id'])
+    if not ended_wake:
         await callback.answer("Нет активного бодрствования!", show_alert=True)
         return
     
-    db.end_wakefulness(active_wake['id'])
-    
-    wake_start = datetime.fromisoformat(active_wake['wake_start'])
-    wake_end = get_moscow_time()
-    duration = int((wake_end - wake_start).total_seconds() / 60)
+    duration = ended_wake['duration_minutes']
     
-    hours = duration // 60
-    minutes = duration % 60
+    hours, minutes = divmod(duration, 60)
     
     await callback.message.edit_text(
         f"🌜 Бодрствование завершено!\n"
         f"👶 Для: {child['first_name']}\n"
-        f"🌞 Начало: {wake_start.strftime('%H:%M')}\n"
-        f"🌜 Конец: {wake_end.strftime('%H:%M')}\n"
+        f"🌞 Начало: {ended_wake['wake_start'][11:16]}\n"
+        f"🌜 Конец: {ended_wake['wake_end'][11:16]}\n"
         f"⏱️ Длительность: {hours}ч {minutes}мин",
-        reply_markup=get_wake_menu_keyboard()
+        reply_markup=get_keyboard("wake_menu")
     )
     await callback.answer()
 
-@router.callback_query(F.data == "wake_stats")
-async def wake_stats_callback(callback: CallbackQuery):
+@callback_handler("wake_stats")
+async def wake_stats_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Статистика бодрствования"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    stats = db.get_wakefulness_stats_today(child['id'])
+    now = get_moscow_time()
+    stats = await db.get_wakefulness_stats_today_cached(child['id'], now.strftime('%Y-%m-%d'))
     
     if stats and stats['wake_count'] > 0:
-        total_hours = stats['total_minutes'] // 60
-        total_minutes = stats['total_minutes'] % 60
-        avg_hours = stats['avg_minutes'] // 60
-        avg_minutes = stats['avg_minutes'] % 60
+        total_hours, total_minutes = divmod(stats['total_minutes'], 60)
+        avg_hours, avg_minutes = divmod(stats['avg_minutes'], 60)
         
-        text = f"📊 Статистика бодрствования за сегодня:\n\n"
-        text += f"👶 Ребенок: {child['first_name']}\n"
-        text += f"📅 Дата: {get_moscow_time().strftime('%d.%m.%Y')}\n"
-        text += f"🌞 Количество периодов: {stats['wake_count']}\n"
-        text += f"⏱️ Общее время: {total_hours}ч {total_minutes}мин\n"
-        text += f"📈 Средняя длительность: {avg_hours}ч {avg_minutes}мин"
+        text = (
+            f"📊 Статистика бодрствования за сегодня:\n\n"
+            f"{child_header(child, now)}"
+            f"🌞 Количество периодов: {stats['wake_count']}\n"
+            f"⏱️ Общее время: {total_hours}ч {total_minutes}мин\n"
+            f"📈 Средняя длительность: {avg_hours}ч {avg_minutes}мин"
+        )
     else:
         text = "📊 Статистика бодрствования за сегодня:\n\n🌞 Данных о бодрствовании за сегодня пока нет"
     
-    await callback.message.edit_text(
+    await edit_text_if_changed(
+        callback.message,
         text,
-        reply_markup=get_wake_menu_keyboard()
+        reply_markup=get_keyboard("wake_menu")
     )
     await callback.answer()
 
 # --- Обработчики подгузников ---
-@router.callback_query(F.data == "diaper_menu")
-async def diaper_menu_callback(callback: CallbackQuery):
+@callback_handler("diaper_menu")
+async def diaper_menu_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Меню подгузников"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    await callback.message.edit_text(
+    await edit_text_if_changed(
+        callback.message,
         f"🩲 Отслеживание подгузников\n\n"
-        f"👶 Ребенок: {child['first_name']}\n"
-        f"📅 Дата: {get_moscow_time().strftime('%d.%m.%Y')}\n\n"
+        f"{child_header(child, get_moscow_time())}\n"
         "Выберите тип:",
-        reply_markup=get_diaper_menu_keyboard()
+        reply_markup=get_keyboard("diaper_menu")
     )
     await callback.answer()
 
-@router.callback_query(F.data.in_(["diaper_urine", "diaper_poop", "diaper_both"]))
-async def process_diaper_callback(callback: CallbackQuery):
+@router.callback_query(F.data.in_(DIAPER_TYPES))
+async def process_diaper_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Обработка подгузников"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка!", show_alert=True)
         return
     
-    diaper_type_map = {
-        "diaper_urine": "мочеиспускание",
-        "diaper_poop": "стул",
-        "diaper_both": "оба"
-    }
+    diaper_type = DIAPER_TYPES[callback.data]
+    await db.add_diaper(child['id'], diaper_type)
     
-    diaper_type = diaper_type_map[callback.data]
-    db.add_diaper(child['id'], diaper_type)
+    now = get_moscow_time()
     
-    current_time = get_moscow_time().strftime("%H:%M")
-    
-    text = f"✅ Подгузник отмечен!\n\n"
-    text += f"👶 Ребенок: {child['first_name']}\n"
-    text += f"📅 Дата: {get_moscow_time().strftime('%d.%m.%Y')}\n"
-    text += f"⏰ Время: {current_time}\n"
-    text += f"🩲 Тип: {diaper_type}\n\n"
+    text = (
+        f"✅ Подгузник отмечен!\n\n"
+        f"{child_header(child, now)}"
+        f"⏰ Время: {now:%H:%M}\n"
+        f"🩲 Тип: {diaper_type}\n\n"
+    )
     
     await callback.message.edit_text(
         text,
-        reply_markup=get_diaper_menu_keyboard()
+        reply_markup=get_keyboard("diaper_menu")
     )
     await callback.answer("✅ Запись сохранена!")
 
-@router.callback_query(F.data == "diaper_stats")
-async def diaper_stats_callback(callback: CallbackQuery):
+@callback_handler("diaper_stats")
+async def diaper_stats_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Статистика подгузников"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    stats = db.get_diaper_stats_today(child['id'])
+    now = get_moscow_time()
+    stats = await db.get_diaper_stats_today_cached(child['id'], now.strftime('%Y-%m-%d'))
     
-    text = f"📊 Статистика подгузников за сегодня:\n\n"
-    text += f"👶 Ребенок: {child['first_name']}\n"
-    text += f"📅 Дата: {get_moscow_time().strftime('%d.%m.%Y')}\n\n"
+    parts = [f"📊 Статистика подгузников за сегодня:\n\n", child_header(child, now), "\n"]
     
     if stats:
         for row in stats:
-            emoji = {"мочеиспускание": "💦", "стул": "💩", "оба": "💦💩"}.get(row['type'], "🩲")
-            text += f"{emoji} {row['type'].title()}: {row['count']} раз\n"
+            emoji = DIAPER_EMOJI.get(row['type'], "🩲")
+            parts.append(f"{emoji} {row['type'].title()}: {row['count']} раз\n")
     else:
-        text += "🩲 Данных за сегодня пока нет"
+        parts.append("🩲 Данных за сегодня пока нет")
     
-    await callback.message.edit_text(
-        text,
-        reply_markup=get_diaper_menu_keyboard()
+    await edit_text_if_changed(
+        callback.message,
+        "".join(parts),
+        reply_markup=get_keyboard("diaper_menu")
     )
     await callback.answer()
 
 # --- Обработчики заметок ---
-@router.callback_query(F.data == "note_menu")
-async def note_menu_callback(callback: CallbackQuery, state: FSMContext):
+@callback_handler("note_menu")
+async def note_menu_callback(callback: CallbackQuery, state: FSMContext, child: Optional[Dict[str, Any]]):
     """Меню заметок"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    await callback.message.edit_text(
+    await edit_text_if_changed(
+        callback.message,
         f"📝 Журнал заметок\n\n"
-        f"👶 Ребенок: {child['first_name']}\n"
-        f"📅 Дата: {get_moscow_time().strftime('%d.%m.%Y')}\n\n"
+        f"{child_header(child, get_moscow_time())}\n"
         "Введите заметку (температура, настроение, особенности поведения, питание и т.д.):\n\n"
         "Для отмены нажмите ❌ Отмена",
-        reply_markup=get_cancel_keyboard()
+        reply_markup=get_keyboard("cancel")
     )
     await state.set_state(NoteTaking.waiting_for_note)
     await callback.answer()
 
 @router.message(NoteTaking.waiting_for_note)
-async def save_note(message: Message, state: FSMContext):
-    child = db.get_child(message.chat.id)
+async def save_note(message: Message, state: FSMContext, child: Optional[Dict[str, Any]]):
     if not child:
         await message.answer("Ребенок не найден!")
         await state.clear()
         return
     
-    db.add_journal_note(child['id'], message.text)
+    await db.add_journal_note(child['id'], message.text)
     
-    recent_notes = db.get_recent_notes(child['id'], 3)
+    recent_notes = await db.get_recent_notes(child['id'], 3)
     
-    text = "✅ Заметка сохранена!\n\n"
-    text += f"📝 Текст: {message.text[:100]}...\n\n"
+    parts: List[str] = [
+        "✅ Заметка сохранена!\n\n",
+        f"📝 Текст: {message.text[:100]}...\n\n"
+    ]
     
     if recent_notes and len(recent_notes) > 1:
-        text += "📋 Последние заметки:\n"
-        for i, note in enumerate(recent_notes[:3]):
-            date = datetime.fromisoformat(note['created_at']).strftime('%d.%m %H:%M')
-            text += f"{i+1}. {date}: {note['note'][:50]}...\n"
+        parts.append("📋 Последние заметки:\n")
+        for i, note in enumerate(recent_notes, 1):
+            created_at = note['created_at']
+            date = f"{created_at[8:10]}.{created_at[5:7]} {created_at[11:16]}"
+            parts.append(f"{i}. {date}: {note['note'][:50]}...\n")
     
-    await message.answer(text)
-    await message.answer("🏠 Главное меню\nВыберите раздел:", reply_markup=get_main_menu_keyboard())
+    text = "".join(parts)
+    
+    # Сбрасываем состояние до отправки: если ответ не уйдет, чат не застрянет в режиме заметки
     await state.clear()
+    await message.answer(with_main_menu(text), reply_markup=get_keyboard("main_menu"))
 
 # --- Команды бота ---
 @router.message(CommandStart())
-async def start_cmd(message: Message):
-    child = db.get_child(message.chat.id)
+async def start_cmd(message: Message, child: Optional[Dict[str, Any]]):
     
     text = "👶 Бот для отслеживания развития ребенка!\n\n"
     
     if child:
-        years, months, days = calculate_age(datetime.strptime(child['birth_date'], "%Y-%m-%d"))
-        text += f"👶 Ребенок: {child['first_name']} {child['last_name'] if child['last_name'] else ''}\n"
+        years, months, days = calculate_age(child['_birth_date'], get_moscow_time().date())
+        text += f"👶 Ребенок: {child['_full_name']}\n"
         text += f"📅 Дата рождения: {child['birth_date']}\n"
         text += f"🎂 Возраст: {years} лет, {months} месяцев, {days} дней\n\n"
         
-    await message.answer(
-        text,
-        parse_mode="Markdown"
-    )
-    
-    await message.answer(
-        "🏠 Главное меню\nВыберите раздел:",
-        reply_markup=get_main_menu_keyboard()
-    )
+    await message.answer(with_main_menu(text), reply_markup=get_keyboard("main_menu"))
 
 @router.message(Command("menu"))
 async def menu_cmd(message: Message):
     """Команда для вызова главного меню"""
     await message.answer(
         "🏠 Главное меню\nВыберите раздел:",
-        reply_markup=get_main_menu_keyboard()
+        reply_markup=get_keyboard("main_menu")
     )
 
 @router.message(Command("help"))
 async def help_cmd(message: Message):
-    help_text = """📋 Доступные команды и функции:
-
-Основные:
-/start - Главное меню
-/register - Регистрация ребенка
-/child_info - Информация о ребенке
-/params - Внести параметры роста/веса
-/stats - Статистика развития
-/menu - Главное меню (inline)
-/help - Справка
-
-Функции для родителей:
-• 💤 Сон - Трекер сна
-• 🌞 Бодрствование - Трекер времени бодрствования
-• 🩲 Подгузник - Трекер смены подгузников
-• 📝 Заметка - Журнал для записей
-
-Для кормлений:
-/feeding - Начать кормление
-/add_eaten [количество] - Добавить съеденное (например: /add_eaten 50)
-/finish - Завершить кормление
-/reset_feeding - Сбросить активное кормление (при багах)
-
-Для отмены ввода:
-/cancel - Отмена текущего действия"""
-    
-    await message.answer(help_text)
+    await message.answer(HELP_TEXT)
 
 # --- Обработчики команд кормления ---
 @router.message(Command("feeding"))
-async def feeding_cmd(message: Message):
+async def feeding_cmd(message: Message, child: Optional[Dict[str, Any]]):
     """Команда для начала кормления"""
     chat_id = message.chat.id
-    child = db.get_child(chat_id)
     
     if not child:
         await message.answer("Сначала зарегистрируйте ребенка с помощью /register")
         return
     
-    active_feeding = db.get_active_feeding(chat_id)
+    active_feeding = await db.get_active_feeding(chat_id)
     if active_feeding:
         await message.answer("Уже есть активное кормление!")
         return
     
-    feeding_id = db.start_feeding(chat_id, child['id'])
+    feeding_id = await db.start_feeding(chat_id, child['id'])
     
-    daily_stats = db.get_daily_feeding_stats(child['id'])
+    daily_stats = await db.get_daily_feeding_stats(child['id'])
     daily_count = daily_stats['feedings_count'] if daily_stats else 0
     daily_total = daily_stats['total_ml'] if daily_stats else 0
     
@@ -1309,101 +1648,101 @@ async def feeding_cmd(message: Message):
         "Добавляйте съеденное по мере кормления:"
     )
     
-    await message.answer(text, reply_markup=get_feeding_control_keyboard())
+    await message.answer(text, reply_markup=get_keyboard("feeding_control"))
 
 @router.message(Command("add_eaten"))
-async def add_eaten_cmd(message: Message):
+async def add_eaten_cmd(message: Message, child: Optional[Dict[str, Any]]):
     """Команда для добавления съеденного количества"""
     chat_id = message.chat.id
-    feeding = db.get_active_feeding(chat_id)
+    feeding = await db.get_active_feeding(chat_id)
     
     if not feeding:
         await message.answer("Нет активного кормления!")
         return
     
-    try:
-        args = message.text.split()
-        if len(args) < 2:
-            await message.answer("Использование: /add_eaten [количество в мл]\nНапример: /add_eaten 50")
-            return
-        
-        eaten_ml = int(args[1])
-        if eaten_ml <= 0 or eaten_ml > 500:
-            await message.answer("Введите количество от 1 до 500 мл!")
-            return
-        
-        db.add_eaten_ml(feeding['id'], eaten_ml)
-        
-        child = db.get_child(chat_id)
-        total_eaten = (feeding['total_eaten_ml'] or 0) + eaten_ml
-        
-        daily_stats = db.get_daily_feeding_stats(child['id'])
-        daily_count = daily_stats['feedings_count'] if daily_stats else 0
-        daily_total = daily_stats['total_ml'] if daily_stats else 0
-        
-        text = (
-            f"✅ Добавлено {eaten_ml} мл\n\n"
-            f"👶 Ребенок: {child['first_name']}\n"
-            f"🍶 Съедено сейчас: {total_eaten} мл\n"
-            f"📊 За сегодня: {daily_count} кормлений, всего {daily_total} мл"
-        )
-        
-        await message.answer(text)
-        
-    except ValueError:
+    args = message.text.split()
+    if len(args) < 2:
+        await message.answer("Использование: /add_eaten [количество в мл]\nНапример: /add_eaten 50")
+        return
+    
+    eaten_ml = parse_number(args[1])
+    if eaten_ml is None:
         await message.answer("Введите число (например: /add_eaten 50)")
+        return
+    if eaten_ml <= 0 or eaten_ml > 500:
+        await message.answer("Введите количество от 1 до 500 мл!")
+        return
+    
+    await db.add_eaten_ml(feeding['id'], eaten_ml)
+    
+    total_eaten = (feeding['total_eaten_ml'] or 0) + eaten_ml
+    
+    daily_stats = await db.get_daily_feeding_stats(child['id'])
+    daily_count = daily_stats['feedings_count'] if daily_stats else 0
+    daily_total = daily_stats['total_ml'] if daily_stats else 0
+    
+    text = (
+        f"✅ Добавлено {eaten_ml} мл\n\n"
+        f"👶 Ребенок: {child['first_name']}\n"
+        f"🍶 Съедено сейчас: {total_eaten} мл\n"
+        f"📊 За сегодня: {daily_count} кормлений, всего {daily_total} мл"
+    )
+    
+    await message.answer(text)
 
 @router.message(Command("finish"))
-async def finish_cmd(message: Message):
+async def finish_cmd(message: Message, child: Optional[Dict[str, Any]]):
     """Команда для завершения кормления"""
     chat_id = message.chat.id
-    feeding = db.get_active_feeding(chat_id)
+    feeding = await db.get_active_feeding(chat_id)
     
     if not feeding:
         await message.answer("Нет активного кормления!")
         return
     
-    db.finish_feeding(feeding['id'])
-    
-    child = db.get_child(chat_id)
-    start_time = datetime.fromisoformat(feeding['start_time'])
-    end_time = get_moscow_time()
-    duration = end_time - start_time
+    finished = await db.finish_feeding(feeding['id'])
+    if not finished:
+        await message.answer("Нет активного кормления!")
+        return
     
-    total_duration_seconds = int(duration.total_seconds()) - (feeding['total_pause_duration'] or 0)
+    total_duration_seconds = finished['duration_seconds']
     
-    daily_stats = db.get_daily_feeding_stats(child['id'])
+    # Дневные итоги считаются по началу кормления: берем сутки из него, чтобы
+    # кормление через полночь попало в показанные итоги, и не читаем часы повторно
+    today_str = finished['start_time'][:10]
+    daily_stats = await db.get_daily_feeding_stats(child['id'], today_str)
     daily_count = daily_stats['feedings_count'] if daily_stats else 0
     daily_total = daily_stats['total_ml'] if daily_stats else 0
 
-    today_feedings = db.get_today_feedings(child['id'])
+    today_feedings = await db.get_today_feedings(child['id'], today_str)
     
-    text = (
+    parts: List[str] = [
         f"✅ Кормление завершено!\n\n"
         f"👶 Ребенок: {child['first_name']}\n"
-        f"⏱️ Начало: {start_time.strftime('%H:%M')}\n"
-        f"⏱️ Конец: {end_time.strftime('%H:%M')}\n"
+        f"⏱️ Начало: {finished['start_time'][11:16]}\n"
+        f"⏱️ Конец: {finished['end_time'][11:16]}\n"
         f"⏳ Длительность: {format_duration(total_duration_seconds)}\n"
         f"🍶 Съедено: {feeding['total_eaten_ml'] or 0} мл\n"
         f"📊 За сегодня: {daily_count} кормлений, всего {daily_total} мл"
-    )
+    ]
     
     if today_feedings:
-        text += "\n\n📋 Кормления за сегодня:\n"
-        for f in today_feedings:
-            text += f"  {f['start_time']} - {f['end_time']}: {f['total_eaten_ml']} мл\n"
+        parts.append("\n\n📋 Кормления за сегодня:\n")
+        for start_time, end_time, eaten_ml in today_feedings:
+            parts.append(f"  {start_time} - {end_time}: {eaten_ml} мл\n")
     
     if feeding['prepared_ml']:
-        text += f"\n🍶 Приготовлено: {feeding['prepared_ml']} мл"
+        parts.append(f"\n🍶 Приготовлено: {feeding['prepared_ml']} мл")
     
-    await message.answer(text)
-    await message.answer("🏠 Главное меню\nВыберите раздел:", reply_markup=get_main_menu_keyboard())
+    text = "".join(parts)
+    
+    await message.answer(with_main_menu(text), reply_markup=get_keyboard("main_menu"))
 
 @router.message(Command("reset_feeding"))
 async def reset_feeding_cmd(message: Message):
     """Команда для сброса активного кормления"""
     chat_id = message.chat.id
-    deleted_count = db.delete_active_feeding(chat_id)
+    deleted_count = await db.delete_active_feeding(chat_id)
     
     if deleted_count > 0:
         await message.answer(f"✅ Удалено {deleted_count} активных кормлений")
@@ -1421,28 +1760,27 @@ async def cancel_cmd(message: Message, state: FSMContext):
     await state.clear()
     await message.answer(
         "❌ Действие отменено",
-        reply_markup=get_main_menu_keyboard()
+        reply_markup=get_keyboard("main_menu")
     )
 
 # --- Обработчики кормления через callback ---
-@router.callback_query(F.data == "start_feeding")
-async def start_feeding_callback(callback: CallbackQuery):
+@callback_handler("start_feeding")
+async def start_feeding_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Начало кормления через callback"""
     chat_id = callback.message.chat.id
-    child = db.get_child(chat_id)
     
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка", show_alert=True)
         return
     
-    active_feeding = db.get_active_feeding(chat_id)
+    active_feeding = await db.get_active_feeding(chat_id)
     if active_feeding:
         await callback.answer("Уже есть активное кормление!", show_alert=True)
         return
     
-    feeding_id = db.start_feeding(chat_id, child['id'])
+    feeding_id = await db.start_feeding(chat_id, child['id'])
     
-    daily_stats = db.get_daily_feeding_stats(child['id'])
+    daily_stats = await db.get_daily_feeding_stats(child['id'])
     daily_count = daily_stats['feedings_count'] if daily_stats else 0
     daily_total = daily_stats['total_ml'] if daily_stats else 0
     
@@ -1457,125 +1795,108 @@ async def start_feeding_callback(callback: CallbackQuery):
     
     await callback.message.edit_text(
         text,
-        reply_markup=get_feeding_control_keyboard()
+        reply_markup=get_keyboard("feeding_control")
     )
     await callback.answer()
 
-@router.callback_query(F.data == "finish_feeding")
-async def finish_feeding_callback(callback: CallbackQuery):
+@callback_handler("finish_feeding")
+async def finish_feeding_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Завершение кормления через callback"""
     chat_id = callback.message.chat.id
-    feeding = db.get_active_feeding(chat_id)
+    feeding = await db.get_active_feeding(chat_id)
     
     if not feeding:
         await callback.answer("Нет активного кормления!", show_alert=True)
         return
     
-    db.finish_feeding(feeding['id'])
-    
-    child = db.get_child(chat_id)
-    start_time = datetime.fromisoformat(feeding['start_time'])
-    end_time = get_moscow_time()
-    duration = end_time - start_time
+    finished = await db.finish_feeding(feeding['id'])
+    if not finished:
+        await callback.answer("Нет активного кормления!", show_alert=True)
+        return
     
-    total_duration_seconds = int(duration.total_seconds()) - (feeding['total_pause_duration'] or 0)
+    total_duration_seconds = finished['duration_seconds']
     
-    daily_stats = db.get_daily_feeding_stats(child['id'])
+    # Дневные итоги считаются по началу кормления: берем сутки из него, чтобы
+    # кормление через полночь попало в показанные итоги, и не читаем часы повторно
+    today_str = finished['start_time'][:10]
+    daily_stats = await db.get_daily_feeding_stats(child['id'], today_str)
     daily_count = daily_stats['feedings_count'] if daily_stats else 0
     daily_total = daily_stats['total_ml'] if daily_stats else 0
 
-    today_feedings = db.get_today_feedings(child['id'])
+    today_feedings = await db.get_today_feedings(child['id'], today_str)
     
-    text = (
+    parts: List[str] = [
         f"✅ Кормление завершено!\n\n"
         f"👶 Ребенок: {child['first_name']}\n"
-        f"⏱️ Начало: {start_time.strftime('%H:%M')}\n"
-        f"⏱️ Конец: {end_time.strftime('%H:%M')}\n"
+        f"⏱️ Начало: {finished['start_time'][11:16]}\n"
+        f"⏱️ Конец: {finished['end_time'][11:16]}\n"
         f"⏳ Длительность: {format_duration(total_duration_seconds)}\n"
         f"🍶 Съедено: {feeding['total_eaten_ml'] or 0} мл\n"
         f"📊 За сегодня: {daily_count} кормлений, всего {daily_total} мл"
-    )
+    ]
     
     if today_feedings:
-        text += "\n\n📋 Кормления за сегодня:\n"
-        for f in today_feedings:
-            text += f"  {f['start_time']} - {f['end_time']}: {f['total_eaten_ml']} мл\n"
+        parts.append("\n\n📋 Кормления за сегодня:\n")
+        for start_time, end_time, eaten_ml in today_feedings:
+            parts.append(f"  {start_time} - {end_time}: {eaten_ml} мл\n")
     
     if feeding['prepared_ml']:
-        text += f"\n🍶 Приготовлено: {feeding['prepared_ml']} мл"
+        parts.append(f"\n🍶 Приготовлено: {feeding['prepared_ml']} мл")
+    
+    text = "".join(parts)
     
     await callback.message.edit_text(
         text,
-        reply_markup=types.InlineKeyboardMarkup(
-            inline_keyboard=[
-                [types.InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-            ]
-        )
+        reply_markup=get_keyboard("main_menu_inline")
     )
     await callback.answer()
 
-@router.callback_query(F.data == "cancel_feeding")
+@callback_handler("cancel_feeding")
 async def cancel_feeding_callback(callback: CallbackQuery):
     """Отмена кормления через callback"""
     chat_id = callback.message.chat.id
-    feeding = db.get_active_feeding(chat_id)
+    feeding = await db.get_active_feeding(chat_id)
     
     if not feeding:
         await callback.answer("Нет активного кормления!", show_alert=True)
         return
     
-    with sqlite3.connect(db.db_name) as conn:
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM feedings WHERE id = ?', (feeding['id'],))
+    await db.delete_feeding(feeding['id'])
     
     await callback.message.edit_text(
         "❌ Кормление отменено",
-        reply_markup=types.InlineKeyboardMarkup(
-            inline_keyboard=[
-                [types.InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-            ]
-        )
+        reply_markup=get_keyboard("main_menu_inline")
     )
     await callback.answer()
 
 # --- Обработчики быстрого добавления еды ---
-@router.callback_query(F.data.in_(["add_5", "add_10", "add_20", "add_30", "add_50", "add_100"]))
-async def add_eaten_quick_callback(callback: CallbackQuery):
+@router.callback_query(AddEatenCallback.filter())
+async def add_eaten_quick_callback(callback: CallbackQuery, callback_data: AddEatenCallback, child: Optional[Dict[str, Any]]):
     """Быстрое добавление съеденного"""
     chat_id = callback.message.chat.id
-    feeding = db.get_active_feeding(chat_id)
+    feeding = await db.get_active_feeding(chat_id)
     
     if not feeding:
         await callback.answer("Нет активного кормления!", show_alert=True)
         return
     
-    ml_map = {
-        "add_5": 5,
-        "add_10": 10,
-        "add_20": 20,
-        "add_30": 30,
-        "add_50": 50,
-        "add_100": 100
-    }
-    
-    eaten_ml = ml_map[callback.data]
-    db.add_eaten_ml(feeding['id'], eaten_ml)
+    eaten_ml = callback_data.ml
+    await db.add_eaten_ml(feeding['id'], eaten_ml)
     
-    child = db.get_child(chat_id)
     if not child:
         await callback.answer("Ребенок не найден!", show_alert=True)
         return
         
     total_eaten = (feeding['total_eaten_ml'] or 0) + eaten_ml
     
-    daily_stats = db.get_daily_feeding_stats(child['id'])
+    daily_stats = await db.get_daily_feeding_stats(child['id'])
     daily_count = daily_stats['feedings_count'] if daily_stats else 0
     daily_total = daily_stats['total_ml'] if daily_stats else 0
     
     text = (
         f"🍼 Кормление продолжается\n\n"
         f"👶 Ребенок: {child['first_name']}\n"
-        f"⏱️ Начало: {datetime.fromisoformat(feeding['start_time']).strftime('%H:%M')}\n"
+        f"⏱️ Начало: {feeding['start_time'][11:16]}\n"
         f"🍶 Съедено сейчас: {total_eaten} мл\n"
         f"📊 За сегодня: {daily_count} кормлений, всего {daily_total} мл\n\n"
         f"✅ Добавлено: {eaten_ml} мл\n\n"
@@ -1584,314 +1905,242 @@ async def add_eaten_quick_callback(callback: CallbackQuery):
     
     await callback.message.edit_text(
         text,
-        reply_markup=get_feeding_control_keyboard()
+        reply_markup=get_keyboard("feeding_control")
     )
     await callback.answer(f"+{eaten_ml} мл")
 
 # --- Обработчик для ввода произвольного количества ---
-@router.callback_query(F.data == "add_custom")
+@callback_handler("add_custom")
 async def add_custom_callback(callback: CallbackQuery, state: FSMContext):
     """Запрос на ввод произвольного количества мл"""
     chat_id = callback.message.chat.id
-    feeding = db.get_active_feeding(chat_id)
+    feeding = await db.get_active_feeding(chat_id)
     
     if not feeding:
         await callback.answer("Нет активного кормления!", show_alert=True)
         return
     
-    await callback.message.edit_text(
+    await edit_text_if_changed(
+        callback.message,
         "📝 Введите количество мл, которое съел ребенок:\n\n"
         "Введите число (например: 75):\n\n"
         "Для отмены нажмите ❌ Отмена",
-        reply_markup=get_cancel_keyboard()
+        reply_markup=get_keyboard("cancel")
     )
     await state.set_state(CustomFeedingAmount.waiting_for_custom_amount)
     await callback.answer()
 
 @router.message(CustomFeedingAmount.waiting_for_custom_amount)
-async def process_custom_amount(message: Message, state: FSMContext):
+async def process_custom_amount(message: Message, state: FSMContext, child: Optional[Dict[str, Any]]):
     """Обработка введенного произвольного количества мл"""
     chat_id = message.chat.id
-    feeding = db.get_active_feeding(chat_id)
+    feeding = await db.get_active_feeding(chat_id)
     
     if not feeding:
         await message.answer("Нет активного кормления!")
         await state.clear()
         return
     
-    try:
-        eaten_ml = int(message.text)
-        if eaten_ml <= 0:
-            await message.answer("Введите положительное число!")
-            return
-        
-        if eaten_ml > 500:
-            await message.answer("Введите количество до 500 мл!")
-            return
-        
-        db.add_eaten_ml(feeding['id'], eaten_ml)
-        
-        child = db.get_child(chat_id)
-        if not child:
-            await message.answer("Ребенок не найден!")
-            await state.clear()
-            return
-            
-        total_eaten = (feeding['total_eaten_ml'] or 0) + eaten_ml
-        
-        daily_stats = db.get_daily_feeding_stats(child['id'])
-        daily_count = daily_stats['feedings_count'] if daily_stats else 0
-        daily_total = daily_stats['total_ml'] if daily_stats else 0
-        
-        text = (
-            f"🍼 Кормление продолжается\n\n"
-            f"👶 Ребенок: {child['first_name']}\n"
-            f"⏱️ Начало: {datetime.fromisoformat(feeding['start_time']).strftime('%H:%M')}\n"
-            f"🍶 Съедено сейчас: {total_eaten} мл\n"
-            f"📊 За сегодня: {daily_count} кормлений, всего {daily_total} мл\n\n"
-            f"✅ Добавлено: {eaten_ml} мл\n\n"
-            "Продолжайте кормить или завершите кормление"
-        )
-        
-        await message.answer(text, reply_markup=get_feeding_control_keyboard())
-        await state.clear()
-        
-    except ValueError:
+    eaten_ml = parse_number(message.text)
+    if eaten_ml is None:
         await message.answer("Пожалуйста, введите число (например: 75):")
+        return
+    
+    if eaten_ml <= 0:
+        await message.answer("Введите положительное число!")
+        return
+    
+    if eaten_ml > 500:
+        await message.answer("Введите количество до 500 мл!")
+        return
+    
+    await db.add_eaten_ml(feeding['id'], eaten_ml)
+    
+    if not child:
+        await message.answer("Ребенок не найден!")
+        await state.clear()
+        return
+    
+    total_eaten = (feeding['total_eaten_ml'] or 0) + eaten_ml
+    
+    daily_stats = await db.get_daily_feeding_stats(child['id'])
+    daily_count = daily_stats['feedings_count'] if daily_stats else 0
+    daily_total = daily_stats['total_ml'] if daily_stats else 0
+    
+    text = (
+        f"🍼 Кормление продолжается\n\n"
+        f"👶 Ребенок: {child['first_name']}\n"
+        f"⏱️ Начало: {feeding['start_time'][11:16]}\n"
+        f"🍶 Съедено сейчас: {total_eaten} мл\n"
+        f"📊 За сегодня: {daily_count} кормлений, всего {daily_total} мл\n\n"
+        f"✅ Добавлено: {eaten_ml} мл\n\n"
+        "Продолжайте кормить или завершите кормление"
+    )
+    
+    await message.answer(text, reply_markup=get_keyboard("feeding_control"))
+    await state.clear()
 
 # --- Обработчики параметров ---
-@router.callback_query(F.data == "update_params")
-async def update_params_callback(callback: CallbackQuery, state: FSMContext):
+@callback_handler("update_params")
+async def update_params_callback(callback: CallbackQuery, state: FSMContext, child: Optional[Dict[str, Any]]):
     """Обновление параметров через callback"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка!", show_alert=True)
         return
     
-    await callback.message.edit_text(
-        f"📊 Внесение параметров\n\n"
-        f"👶 Ребенок: {child['first_name']}\n\n"
-        "Введите текущий вес ребенка в граммах (например: 4500):\n\n"
-        "Для отмены нажмите ❌ Отмена",
-        reply_markup=get_cancel_keyboard()
+    await edit_text_if_changed(
+        callback.message,
+        UPDATE_PARAMS_TEMPLATE(first_name=child['first_name']),
+        reply_markup=get_keyboard("cancel")
     )
     await state.set_state(UpdateParams.waiting_for_weight)
     await callback.answer()
 
 @router.message(UpdateParams.waiting_for_weight)
 async def process_weight(message: Message, state: FSMContext):
-    try:
-        weight = float(message.text)
-        if 500 <= weight <= 20000:
-            await state.update_data(weight=weight)
-            await message.answer(
-                "Введите текущий рост в см (например: 60):\n\n"
-                "Для отмены нажмите ❌ Отмена",
-                reply_markup=get_cancel_keyboard()
-            )
-            await state.set_state(UpdateParams.waiting_for_height)
-        else:
-            await message.answer("Введите вес от 500 до 20000 грамм:")
-    except ValueError:
+    weight = parse_float(message.text)
+    if weight is None:
         await message.answer("Введите число (например: 4500):")
+        return
+    
+    if 500 <= weight <= 20000:
+        await state.update_data(weight=weight)
+        await message.answer(
+            "Введите текущий рост в см (например: 60):\n\n"
+            "Для отмены нажмите ❌ Отмена",
+            reply_markup=get_keyboard("cancel")
+        )
+        await state.set_state(UpdateParams.waiting_for_height)
+    else:
+        await message.answer("Введите вес от 500 до 20000 грамм:")
 
 @router.message(UpdateParams.waiting_for_height)
-async def process_height(message: Message, state: FSMContext):
-    try:
-        height = int(message.text)
-        if 30 <= height <= 120:
-            child = db.get_child(message.chat.id)
-            if not child:
-                await message.answer("Ребенок не найден!")
-                await state.clear()
-                return
-                
-            data = await state.get_data()
-            
-            db.add_measurement(child['id'], data['weight'], height)
-            
-            last_measurement = db.get_last_measurement(child['id'])
-            
-            text = "✅ Параметры успешно сохранены!\n\n"
-            if last_measurement:
-                text += (
-                    f"⚖️ Вес: {data['weight']} г\n"
-                    f"📏 Рост: {height} см\n"
-                    f"📅 Дата измерения: {datetime.now().strftime('%d.%m.%Y')}"
-                )
-            
-            await message.answer(text)
-            await message.answer("🏠 Главное меню\nВыберите раздел:", reply_markup=get_main_menu_keyboard())
-            await state.clear()
-        else:
-            await message.answer("Введите рост от 30 до 120 см:")
-    except ValueError:
+async def process_height(message: Message, state: FSMContext, child: Optional[Dict[str, Any]]):
+    height = parse_number(message.text)
+    if height is None:
         await message.answer("Введите число (например: 60):")
+        return
+    
+    if 30 <= height <= 120:
+        if not child:
+            await message.answer("Ребенок не найден!")
+            await state.clear()
+            return
+            
+        data = await state.get_data()
+        
+        await db.add_measurement(child['id'], data['weight'], height)
+        
+        last_measurement = await db.get_last_measurement_cached(child['id'])
+        
+        text = "✅ Параметры успешно сохранены!\n\n"
+        if last_measurement:
+            text += (
+                f"⚖️ Вес: {data['weight']} г\n"
+                f"📏 Рост: {height} см\n"
+                f"📅 Дата измерения: {get_moscow_time().strftime('%d.%m.%Y')}"
+            )
+        
+        await message.answer(with_main_menu(text), reply_markup=get_keyboard("main_menu"))
+        await state.clear()
+    else:
+        await message.answer("Введите рост от 30 до 120 см:")
 
 # --- Обработчики статистики ---
-@router.callback_query(F.data == "show_stats")
-async def show_stats_callback(callback: CallbackQuery):
+@callback_handler("show_stats")
+async def show_stats_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Показать статистику через callback"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Сначала зарегистрируйте ребенка!", show_alert=True)
         return
     
-    await show_stats_dialog(callback.message)
+    await show_stats_dialog(callback.message, child)
     await callback.answer()
 
-async def show_stats_dialog(message: Message):
-    child = db.get_child(message.chat.id)
+async def show_stats_dialog(message: Message, child: Optional[Dict[str, Any]]):
     if not child:
         await message.answer("Сначала зарегистрируйте ребенка")
         return
     
-    with sqlite3.connect(db.db_name) as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT 
-                date(start_time) as feeding_date,
-                COUNT(*) as feedings_count,
-                SUM(total_eaten_ml) as total_ml
-            FROM feedings 
-            WHERE child_id = ? 
-            AND date(start_time) >= date('now', '-7 days')
-            GROUP BY date(start_time)
-            ORDER BY feeding_date DESC
-        ''', (child['id'],))
-        
-        feedings_stats = cursor.fetchall()
-        
-        cursor.execute('''
-            SELECT weight, height, measurement_date, recorded_at
-            FROM measurements
-            WHERE child_id = ?
-            ORDER BY measurement_date DESC, recorded_at DESC
-            LIMIT 5
-        ''', (child['id'],))
-        
-        measurements = cursor.fetchall()
+    today_str = get_moscow_time().strftime('%Y-%m-%d')
+    feedings_stats, measurements, today_feedings, summary = await db.get_stats_screen_cached(child['id'], today_str)
     
-    text = f"📊 Статистика для {child['first_name']}\n\n"
+    parts: List[str] = [STATS_HEADER_TEMPLATE(first_name=child['first_name'])]
     
     # Детальные кормления за сегодня
-    today_feedings = db.get_today_feedings(child['id'])
-    daily_stats = db.get_daily_feeding_stats(child['id'])
     if today_feedings:
-        text += "🍼 Кормления сегодня:\n"
-        for f in today_feedings:
-            text += f"  {f['start_time']} - {f['end_time']}: {f['total_eaten_ml']} мл\n"
-        text += f"  Всего за сегодня: {daily_stats['total_ml']} мл ({daily_stats['feedings_count']} корм.)\n\n"
+        parts.append("🍼 Кормления сегодня:\n")
+        for start_time, end_time, eaten_ml in today_feedings:
+            parts.append(f"  {start_time} - {end_time}: {eaten_ml} мл\n")
+        parts.append(f"  Всего за сегодня: {summary['feedings_ml']} мл ({summary['feedings_count']} корм.)\n\n")
     else:
-        text += "🍼 Сегодня кормлений не было.\n\n"
+        parts.append("🍼 Сегодня кормлений не было.\n\n")
     
     if feedings_stats:
-        text += "🍼 Кормления за последние 7 дней:\n"
-        for stat in feedings_stats:
-            text += f"  📅 {stat['feeding_date']}: {stat['feedings_count']} кормлений, {stat['total_ml'] or 0} мл\n"
-        text += "\n"
+        parts.append("🍼 Кормления за последние 7 дней:\n")
+        for feeding_date, feedings_count, total_ml in feedings_stats:
+            parts.append(f"  📅 {feeding_date}: {feedings_count} кормлений, {total_ml or 0} мл\n")
+        parts.append("\n")
     
     if measurements:
-        text += "📈 Динамика параметров:\n"
-        for i, m in enumerate(measurements):
-            recorded_time = ""
-            if m['recorded_at']:
-                try:
-                    if isinstance(m['recorded_at'], str):
-                        dt = datetime.fromisoformat(m['recorded_at'])
-                        recorded_time = f" ({dt.strftime('%H:%M')})"
-                except:
-                    pass
+        parts.append("📈 Динамика параметров:\n")
+        for i, (weight, height, measurement_date, recorded_time) in enumerate(measurements):
+            recorded_time = f" ({recorded_time})" if recorded_time else ""
             
             if i == 0:
-                text += f"  📅 {m['measurement_date']}{recorded_time}: {m['weight']} г, {m['height']} см (последнее)\n"
+                parts.append(f"  📅 {measurement_date}{recorded_time}: {weight} г, {height} см (последнее)\n")
             else:
-                text += f"  📅 {m['measurement_date']}{recorded_time}: {m['weight']} г, {m['height']} см\n"
+                parts.append(f"  📅 {measurement_date}{recorded_time}: {weight} г, {height} см\n")
     else:
-        text += "📏 Нет данных об измерениях\n"
+        parts.append("📏 Нет данных об измерениях\n")
     
     # Статистика сна, бодрствования, подгузников
-    sleep_stats = db.get_sleep_stats_today(child['id'])
-    wake_stats = db.get_wakefulness_stats_today(child['id'])
-    diaper_stats = db.get_diaper_stats_today(child['id'])
-    
-    if sleep_stats and sleep_stats['sleep_count']:
-        total_hours = sleep_stats['total_minutes'] // 60
-        total_minutes = sleep_stats['total_minutes'] % 60
-        text += f"\n💤 Сон сегодня: {sleep_stats['sleep_count']} раз, {total_hours}ч {total_minutes}мин"
-    
-    if wake_stats and wake_stats['wake_count']:
-        total_hours = wake_stats['total_minutes'] // 60
-        total_minutes = wake_stats['total_minutes'] % 60
-        text += f"\n🌞 Бодрствование сегодня: {wake_stats['wake_count']} раз, {total_hours}ч {total_minutes}мин"
-    
-    if diaper_stats:
-        text += f"\n🩲 Подгузники сегодня: "
-        for row in diaper_stats:
-            emoji = {"мочеиспускание": "💦", "стул": "💩", "оба": "💦💩"}.get(row['type'], "🩲")
-            text += f"{emoji}{row['count']} "
-    
-    await message.answer(text)
-    await message.answer("🏠 Главное меню\nВыберите раздел:", reply_markup=get_main_menu_keyboard())
+    if summary['sleep_count']:
+        total_hours, total_minutes = divmod(summary['sleep_minutes'], 60)
+        parts.append(f"\n💤 Сон сегодня: {summary['sleep_count']} раз, {total_hours}ч {total_minutes}мин")
+    
+    if summary['wake_count']:
+        total_hours, total_minutes = divmod(summary['wake_minutes'], 60)
+        parts.append(f"\n🌞 Бодрствование сегодня: {summary['wake_count']} раз, {total_hours}ч {total_minutes}мин")
+    
+    diaper_counts = [(DIAPER_EMOJI[diaper_type], summary[key])
+                     for key, diaper_type in DIAPER_TYPES.items() if summary[key]]
+    if diaper_counts:
+        parts.append(f"\n🩲 Подгузники сегодня: ")
+        for emoji, count in diaper_counts:
+            parts.append(f"{emoji}{count} ")
+    
+    # У активных пользователей статистика может не уместиться в одно сообщение
+    *head, tail = split_into_messages(parts)
+    for chunk in head:
+        await message.answer(chunk)
+    await message.answer(with_main_menu(tail), reply_markup=get_keyboard("main_menu"))
 
 # --- Обработчики информации о ребенке ---
-@router.callback_query(F.data == "child_info")
-async def child_info_callback(callback: CallbackQuery):
+@callback_handler("child_info")
+async def child_info_callback(callback: CallbackQuery, child: Optional[Dict[str, Any]]):
     """Информация о ребенке"""
-    child = db.get_child(callback.message.chat.id)
     if not child:
         await callback.answer("Ребенок не зарегистрирован", show_alert=True)
         return
     
-    years, months, days = calculate_age(datetime.strptime(child['birth_date'], "%Y-%m-%d"))
-    last_measurement = db.get_last_measurement(child['id'])
-    
-    text = (
-        f"👶 Информация о ребенке\n\n"
-        f"👶 Ребенок: {child['first_name']} {child['last_name'] if child['last_name'] else ''}\n"
-        f"🚻 Пол: {child['gender']}\n"
-        f"📅 Дата рождения: {child['birth_date']}\n"
-        f"🎂 Возраст: {years} лет, {months} месяцев, {days} дней\n"
-        f"🤰 Срок беременности: {child['gestation_weeks']} нед. {child['gestation_days']} дн.\n"
-        f"⚖️ Вес при рождении: {child['birth_weight']} г\n"
-        f"📏 Рост при рождении: {child['birth_height']} см\n"
-    )
-    
-    if last_measurement:
-        weight_gain = last_measurement['weight'] - child['birth_weight']
-        height_gain = last_measurement['height'] - child['birth_height']
-        
-        text += (
-            f"\n📊 Последние измерения:\n"
-            f"⚖️ Вес: {last_measurement['weight']} г (+{weight_gain} г)\n"
-            f"📏 Рост: {last_measurement['height']} см (+{height_gain} см)\n"
-            f"📅 Дата: {last_measurement['measurement_date']}\n"
-            f"🎂 Возраст на момент измерения: {last_measurement['age_days']} дней"
-        )
-    
-    await callback.message.edit_text(
-        text,
-        reply_markup=types.InlineKeyboardMarkup(
-            inline_keyboard=[
-                [types.InlineKeyboardButton(text="🏠 В главное меню", callback_data="main_menu")]
-            ]
-        )
+    await edit_text_if_changed(
+        callback.message,
+        await format_child_info(child),
+        reply_markup=get_keyboard("main_menu_inline")
     )
     await callback.answer()
 
 # --- Обработчики команды /register ---
 @router.message(Command("register"))
-async def register_child_cmd(message: Message, state: FSMContext):
-    child = db.get_child(message.chat.id)
+async def register_child_cmd(message: Message, state: FSMContext, child: Optional[Dict[str, Any]]):
     if child:
         await message.answer("Ребенок уже зарегистрирован! Используйте /child_info для просмотра данных.")
         return
     await message.answer(
         "Введите имя ребенка:\n\n"
         "Для отмены нажмите ❌ Отмена",
-        reply_markup=get_cancel_keyboard()
+        reply_markup=get_keyboard("cancel")
     )
     await state.set_state(ChildRegistration.waiting_for_first_name)
 
@@ -1901,7 +2150,7 @@ async def process_first_name(message: Message, state: FSMContext):
     await message.answer(
         "Введите фамилию ребенка (или напишите '-' если нет):\n\n"
         "Для отмены нажмите ❌ Отмена",
-        reply_markup=get_cancel_keyboard()
+        reply_markup=get_keyboard("cancel")
     )
     await state.set_state(ChildRegistration.waiting_for_last_name)
 
@@ -1909,7 +2158,7 @@ async def process_first_name(message: Message, state: FSMContext):
 async def process_last_name(message: Message, state: FSMContext):
     last_name = message.text if message.text != '-' else ''
     await state.update_data(last_name=last_name)
-    await message.answer("Выберите пол ребенка:", reply_markup=get_gender_keyboard())
+    await message.answer("Выберите пол ребенка:", reply_markup=get_keyboard("gender"))
     await state.set_state(ChildRegistration.waiting_for_gender)
 
 @router.callback_query(ChildRegistration.waiting_for_gender, F.data.startswith("gender_"))
@@ -1919,7 +2168,7 @@ async def process_gender(callback: CallbackQuery, state: FSMContext):
     await callback.message.answer(
         "Введите дату рождения в формате ДД.ММ.ГГГГ:\n\n"
         "Для отмены нажмите ❌ Отмена",
-        reply_markup=get_cancel_keyboard()
+        reply_markup=get_keyboard("cancel")
     )
     await state.set_state(ChildRegistration.waiting_for_birth_date)
     await callback.answer()
@@ -1932,7 +2181,7 @@ async def process_birth_date(message: Message, state: FSMContext):
         await message.answer(
             "Введите срок беременности (недели от 20 до 42):\n\n"
             "Для отмены нажмите ❌ Отмена",
-            reply_markup=get_cancel_keyboard()
+            reply_markup=get_keyboard("cancel")
         )
         await state.set_state(ChildRegistration.waiting_for_gestation_weeks)
     except ValueError:
@@ -1940,131 +2189,104 @@ async def process_birth_date(message: Message, state: FSMContext):
 
 @router.message(ChildRegistration.waiting_for_gestation_weeks)
 async def process_gestation_weeks(message: Message, state: FSMContext):
-    try:
-        weeks = int(message.text)
-        if 20 <= weeks <= 42:
-            await state.update_data(gestation_weeks=weeks)
-            await message.answer(
-                "Введите дополнительные дни срока (0-6):\n\n"
-                "Для отмены нажмите ❌ Отмена",
-                reply_markup=get_cancel_keyboard()
-            )
-            await state.set_state(ChildRegistration.waiting_for_gestation_days)
-        else:
-            await message.answer("Введите число от 20 до 42:")
-    except ValueError:
+    weeks = parse_number(message.text)
+    if weeks is None:
+        await message.answer("Введите число от 20 до 42:")
+        return
+    
+    if 20 <= weeks <= 42:
+        await state.update_data(gestation_weeks=weeks)
+        await message.answer(
+            "Введите дополнительные дни срока (0-6):\n\n"
+            "Для отмены нажмите ❌ Отмена",
+            reply_markup=get_keyboard("cancel")
+        )
+        await state.set_state(ChildRegistration.waiting_for_gestation_days)
+    else:
         await message.answer("Введите число от 20 до 42:")
 
 @router.message(ChildRegistration.waiting_for_gestation_days)
 async def process_gestation_days(message: Message, state: FSMContext):
-    try:
-        days = int(message.text)
-        if 0 <= days <= 6:
-            await state.update_data(gestation_days=days)
-            await message.answer(
-                "Введите вес при рождении (в граммах, например: 3500):\n\n"
-                "Для отмены нажмите ❌ Отмена",
-                reply_markup=get_cancel_keyboard()
-            )
-            await state.set_state(ChildRegistration.waiting_for_birth_weight)
-        else:
-            await message.answer("Введите число от 0 до 6:")
-    except ValueError:
+    days = parse_number(message.text)
+    if days is None:
+        await message.answer("Введите число от 0 до 6:")
+        return
+    
+    if 0 <= days <= 6:
+        await state.update_data(gestation_days=days)
+        await message.answer(
+            "Введите вес при рождении (в граммах, например: 3500):\n\n"
+            "Для отмены нажмите ❌ Отмена",
+            reply_markup=get_keyboard("cancel")
+        )
+        await state.set_state(ChildRegistration.waiting_for_birth_weight)
+    else:
         await message.answer("Введите число от 0 до 6:")
 
 @router.message(ChildRegistration.waiting_for_birth_weight)
 async def process_birth_weight(message: Message, state: FSMContext):
-    try:
-        weight = float(message.text)
-        if 500 <= weight <= 6000:
-            await state.update_data(birth_weight=weight)
-            await message.answer(
-                "Введите рост при рождении (в см, например: 52):\n\n"
-                "Для отмены нажмите ❌ Отмена",
-                reply_markup=get_cancel_keyboard()
-            )
-            await state.set_state(ChildRegistration.waiting_for_birth_height)
-        else:
-            await message.answer("Введите вес от 500 до 6000 грамм:")
-    except ValueError:
+    weight = parse_float(message.text)
+    if weight is None:
         await message.answer("Введите число (например: 3500):")
+        return
+    
+    if 500 <= weight <= 6000:
+        await state.update_data(birth_weight=weight)
+        await message.answer(
+            "Введите рост при рождении (в см, например: 52):\n\n"
+            "Для отмены нажмите ❌ Отмена",
+            reply_markup=get_keyboard("cancel")
+        )
+        await state.set_state(ChildRegistration.waiting_for_birth_height)
+    else:
+        await message.answer("Введите вес от 500 до 6000 грамм:")
 
 @router.message(ChildRegistration.waiting_for_birth_height)
 async def process_birth_height(message: Message, state: FSMContext):
-    try:
-        height = int(message.text)
-        if 30 <= height <= 70:
-            data = await state.get_data()
-            data['birth_height'] = height
+    height = parse_number(message.text)
+    if height is None:
+        await message.answer("Введите число (например: 52):")
+        return
+    
+    if 30 <= height <= 70:
+        data = await state.get_data()
+        data['birth_height'] = height
+        
+        child_id = await db.register_child(message.chat.id, data)
+        
+        if child_id:
+            years, months, days = calculate_age(date.fromisoformat(data['birth_date']), get_moscow_time().date())
             
-            child_id = db.register_child(message.chat.id, data)
+            text = REGISTERED_TEMPLATE(
+                full_name=full_name(data),
+                gender=data['gender'],
+                birth_date=data['birth_date'],
+                years=years, months=months, days=days,
+                gestation_weeks=data['gestation_weeks'],
+                gestation_days=data['gestation_days'],
+                birth_weight=data['birth_weight'],
+                birth_height=data['birth_height']
+            )
             
-            if child_id:
-                years, months, days = calculate_age(datetime.strptime(data['birth_date'], "%Y-%m-%d"))
-                
-                text = (
-                    "✅ Ребенок успешно зарегистрирован!\n\n"
-                    f"👶 Имя: {data['first_name']} {data['last_name'] if data['last_name'] else ''}\n"
-                    f"🚻 Пол: {data['gender']}\n"
-                    f"📅 Дата рождения: {data['birth_date']}\n"
-                    f"🎂 Возраст: {years} лет, {months} месяцев, {days} дней\n"
-                    f"🤰 Срок беременности: {data['gestation_weeks']} недель {data['gestation_days']} дней\n"
-                    f"⚖️ Вес при рождении: {data['birth_weight']} г\n"
-                    f"📏 Рост при рождении: {data['birth_height']} см\n\n"
-                    "Теперь вы можете начать отслеживать кормления и параметры развития."
-                )
-                
-                await message.answer(text)
-                await message.answer("🏠 Главное меню\nВыберите раздел:", reply_markup=get_main_menu_keyboard())
-                await state.clear()
-                
-                db.add_measurement(child_id, data['birth_weight'], data['birth_height'])
-            else:
-                await message.answer("Ошибка регистрации ребенка. Попробуйте еще раз.")
+            await message.answer(with_main_menu(text), reply_markup=get_keyboard("main_menu"))
+            await state.clear()
+            
+            await db.add_measurement(child_id, data['birth_weight'], data['birth_height'])
         else:
-            await message.answer("Введите рост от 30 до 70 см:")
-    except ValueError:
-        await message.answer("Введите число (например: 52):")
+            await message.answer("Ошибка регистрации ребенка. Попробуйте еще раз.")
+    else:
+        await message.answer("Введите рост от 30 до 70 см:")
 
 @router.message(Command("child_info"))
-async def child_info_cmd(message: Message):
-    child = db.get_child(message.chat.id)
+async def child_info_cmd(message: Message, child: Optional[Dict[str, Any]]):
     if not child:
         await message.answer("Ребенок не зарегистрирован. Используйте /register")
         return
     
-    years, months, days = calculate_age(datetime.strptime(child['birth_date'], "%Y-%m-%d"))
-    last_measurement = db.get_last_measurement(child['id'])
-    
-    text = (
-        f"👶 Информация о ребенке\n\n"
-        f"👶 Ребенок: {child['first_name']} {child['last_name'] if child['last_name'] else ''}\n"
-        f"🚻 Пол: {child['gender']}\n"
-        f"📅 Дата рождения: {child['birth_date']}\n"
-        f"🎂 Возраст: {years} лет, {months} месяцев, {days} дней\n"
-        f"🤰 Срок беременности: {child['gestation_weeks']} нед. {child['gestation_days']} дн.\n"
-        f"⚖️ Вес при рождении: {child['birth_weight']} г\n"
-        f"📏 Рост при рождении: {child['birth_height']} см\n"
-    )
-    
-    if last_measurement:
-        weight_gain = last_measurement['weight'] - child['birth_weight']
-        height_gain = last_measurement['height'] - child['birth_height']
-        
-        text += (
-            f"\n📊 Последние измерения:\n"
-            f"⚖️ Вес: {last_measurement['weight']} г (+{weight_gain} г)\n"
-            f"📏 Рост: {last_measurement['height']} см (+{height_gain} см)\n"
-            f"📅 Дата: {last_measurement['measurement_date']}\n"
-            f"🎂 Возраст на момент измерения: {last_measurement['age_days']} дней"
-        )
-    
-    await message.answer(text)
-    await message.answer("🏠 Главное меню\nВыберите раздел:", reply_markup=get_main_menu_keyboard())
+    await message.answer(with_main_menu(await format_child_info(child)), reply_markup=get_keyboard("main_menu"))
 
 @router.message(Command("params"))
-async def params_cmd(message: Message, state: FSMContext):
-    child = db.get_child(message.chat.id)
+async def params_cmd(message: Message, state: FSMContext, child: Optional[Dict[str, Any]]):
     if not child:
         await message.answer("Сначала зарегистрируйте ребенка с помощью /register")
         return
@@ -2072,58 +2294,118 @@ async def params_cmd(message: Message, state: FSMContext):
     await message.answer(
         "Введите текущий вес ребенка в граммах (например: 4500):\n\n"
         "Для отмены нажмите ❌ Отмена",
-        reply_markup=get_cancel_keyboard()
+        reply_markup=get_keyboard("cancel")
     )
     await state.set_state(UpdateParams.waiting_for_weight)
 
 @router.message(Command("stats"))
-async def stats_cmd(message: Message):
-    await show_stats_dialog(message)
+async def stats_cmd(message: Message, child: Optional[Dict[str, Any]]):
+    await show_stats_dialog(message, child)
 
 # --- Заглушка для неиспользуемых callback-данных ---
-@router.callback_query(F.data.in_([
+PLACEHOLDER_CALLBACKS = frozenset({
     "temp_tracking", "vaccination_info", "doctor_visit", "medical_record",
     "general_stats", "feeding_stats", "weight_chart", "height_chart", 
     "monthly_report", "daily_report", "sleep_history"
-]))
+})
+
+@router.callback_query(F.data.in_(PLACEHOLDER_CALLBACKS))
 async def placeholder_callback(callback: CallbackQuery):
     """Заглушка для пока не реализованных функций"""
     await callback.answer("Эта функция скоро будет доступна! ⏳", show_alert=True)
 
 # --- Система напоминаний ---
+# Рекомендуемая частота измерений: до 14 дней включительно, до 90 дней включительно, старше
+REMINDER_AGE_LIMITS = (14, 90)
+REMINDER_FREQUENCY_TEXTS = ("ежедневно", "еженедельно", "ежемесячно")
+
+def reminder_frequency_text(age_days: int) -> str:
+    """Рекомендуемая частота измерений для возраста в днях"""
+    return REMINDER_FREQUENCY_TEXTS[bisect.bisect_left(REMINDER_AGE_LIMITS, age_days)]
+
+async def send_reminder(semaphore: asyncio.Semaphore, chat_id: int, text: str):
+    """Отправляет одно напоминание, не превышая лимит одновременных запросов"""
+    async with semaphore:
+        try:
+            await bot.send_message(chat_id, text)
+        except TelegramRetryAfter as e:
+            # Telegram просит подождать при превышении лимита: ждем, не отпуская слот, и пробуем еще раз
+            await asyncio.sleep(e.retry_after)
+            await bot.send_message(chat_id, text)
+
+def reminder_time(day: date) -> datetime:
+    """Московское время рассылки напоминаний в день day"""
+    return datetime.combine(day, datetime.min.time()) + timedelta(hours=REMINDER_HOUR)
+
+def seconds_until(moment: datetime) -> float:
+    """Секунды до московского времени moment (не меньше нуля)"""
+    return max((moment - get_moscow_time()).total_seconds(), 0)
+
+async def wait_for_next_reminder_day():
+    """Спит до REMINDER_HOUR дня ближайшего напоминания.
+    Если напоминания меняются, срок пересчитывается, но сегодняшние повторно не отправляются"""
+    while True:
+        db.reminders_changed.clear()
+        next_date = await db.get_next_reminder_date()
+        if next_date is None:
+            timeout = None
+        else:
+            now = get_moscow_time()
+            # До часа рассылки сегодняшние напоминания еще не отправлены
+            earliest = now.date() if now < reminder_time(now.date()) else now.date() + timedelta(days=1)
+            wake_time = reminder_time(max(next_date, earliest))
+            timeout = seconds_until(wake_time)
+        try:
+            await asyncio.wait_for(db.reminders_changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            # Таймаут идет по монотонным часам и может сработать чуть раньше срока по МСК:
+            # досыпаем, иначе проснемся до часа рассылки
+            while get_moscow_time() < wake_time:
+                await asyncio.sleep(seconds_until(wake_time))
+            return
+
 async def check_reminders():
     while True:
         try:
-            reminders = db.get_reminders_due()
+            now = get_moscow_time()
+            # При запуске до часа рассылки ничего не шлем: ожидание разбудит нас в REMINDER_HOUR
+            if now < reminder_time(now.date()):
+                await wait_for_next_reminder_day()
+                continue
+            # Данные ребенка приходят тем же запросом, что и сами напоминания
+            reminders = await db.get_reminders_due(now.date())
+            semaphore = asyncio.Semaphore(REMINDER_SEND_CONCURRENCY)
+            sends = []
             for reminder in reminders:
-                child = db.get_child(reminder['chat_id'])
-                if child:
-                    birth_date = datetime.strptime(child['birth_date'], "%Y-%m-%d")
-                    age_days = (get_moscow_time().date() - birth_date.date()).days
-                    
-                    if age_days <= 14:
-                        frequency_text = "ежедневно"
-                    elif age_days <= 90:
-                        frequency_text = "еженедельно"
-                    else:
-                        frequency_text = "ежемесячно"
-                    
-                    text = (
-                        f"🔔 Напоминание для {child['first_name']}\n\n"
-                        f"Пора измерить параметры развития ребенка!\n"
-                        f"📅 Возраст: {age_days} дней\n"
-                        f"📋 Рекомендуемая частота: {frequency_text}\n\n"
-                        f"Используйте кнопку '📊 Параметры' для внесения данных."
-                    )
-                    
-                    await bot.send_message(reminder['chat_id'], text)
+                age_days = reminder['age_days']
+                text = REMINDER_TEMPLATE(
+                    first_name=reminder['first_name'],
+                    age_days=age_days,
+                    frequency=reminder_frequency_text(age_days)
+                )
+                sends.append(send_reminder(semaphore, reminder['chat_id'], text))
             
-            await asyncio.sleep(24 * 60 * 60)
+            results = await asyncio.gather(*sends, return_exceptions=True)
+            for reminder, result in zip(reminders, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Не удалось отправить напоминание в чат {reminder['chat_id']}: {result}")
+            
+            await wait_for_next_reminder_day()
         except Exception as e:
             logger.error(f"Ошибка в проверке напоминаний: {e}")
             await asyncio.sleep(60 * 60)
 
 # --- Запуск бота ---
+async def on_startup():
+    """Открываем базу до приема первых апдейтов и запускаем напоминания"""
+    await db.connect()
+    asyncio.create_task(check_reminders())
+
+async def on_shutdown():
+    """Корректно закрываем базу, чтобы WAL был сброшен в основной файл"""
+    await db.close()
+    logger.info("Соединение с базой закрыто")
+
 async def main():
     logger.info("Бот запущен!")
     
@@ -2134,9 +2416,15 @@ async def main():
     except Exception as e:
         logger.error(f"Ошибка при удалении вебхука: {e}")
     
-    asyncio.create_task(check_reminders())
-    
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
+    # uvloop заметно быстрее стандартного цикла событий, но под Windows его нет
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
     asyncio.run(main())